@@ -0,0 +1,205 @@
+# Backups of the database with the sqlite online backup API
+# The database is copied a few pages at a time from a snapshot, so logging goes on while a backup is made
+
+import datetime
+import gzip
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+
+import models
+from cache import bump
+from config import as_boolean
+
+# pages copied in one step, between the steps other connections can write
+PAGES_PER_STEP = 256
+# seconds to wait after every step, long enough for a waiting write to get the database
+PAUSE = 0.001
+# backup-2024-01-31_184502_123456.db or .db.gz, with microseconds two backups never get the same name
+BACKUP_NAME = re.compile(r"^backup-(\d{4}-\d{2}-\d{2}_\d{6}_\d{6})\.db(\.gz)?$")
+TIME_FORMAT = "%Y-%m-%d_%H%M%S_%f"
+
+
+def in_memory():
+    """Return True if the database only lives in memory"""
+    return not models.DATABASE or models.DATABASE == ":memory:"
+
+
+def backup_directory():
+    """Return the directory for the backups, from the settings or next to the database"""
+    directory = models.SETTINGS["backup_dir"]
+    if not directory:
+        if in_memory():
+            raise ValueError("An in memory database has no place for backups, set backup_dir.")
+        directory = os.path.dirname(os.path.abspath(models.DATABASE)) + os.sep + "backups"
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def raw_connection():
+    """Return the sqlite3 connection below the session"""
+    return models.session.connection().connection.connection
+
+
+def snapshot_connection():
+    """Return a sqlite3 connection to the database with an open read transaction.
+    The backup reads this snapshot, without it every write of another connection would restart
+    the backup. With the write ahead log writes go on, the rollback journal makes them wait"""
+    if in_memory():
+        return raw_connection()  # in memory, there is only the connection of the session
+    connection = sqlite3.connect(models.DATABASE, isolation_level=None)
+    connection.execute("BEGIN")
+    connection.execute("SELECT count(*) FROM sqlite_master").fetchone()
+    return connection
+
+
+def copy_database(source, target, pages=PAGES_PER_STEP):
+    """Copy one sqlite3 database into another, pages at a time"""
+    source.backup(target, pages=pages, progress=lambda *_: time.sleep(PAUSE))
+
+
+def create_backup(directory=None, compress=None, pages=PAGES_PER_STEP, prune=True):
+    """Write a backup with the time in its name, then remove the backups the retention doesn't keep.
+    Return the path of the new backup"""
+    directory = directory or backup_directory()
+    if compress is None:
+        compress = as_boolean(models.SETTINGS["backup_compress"])
+    models.session.commit()  # everything logged so far is in the backup
+    name = "backup-" + datetime.datetime.now().strftime(TIME_FORMAT) + ".db"
+    path = directory + os.sep + name + (".gz" if compress else "")
+    # written to a temporary file first, a backup that is in the directory is always complete
+    handle, temporary = tempfile.mkstemp(suffix=".db", dir=directory)
+    os.close(handle)
+    try:
+        source = snapshot_connection()
+        target = sqlite3.connect(temporary)
+        try:
+            copy_database(source, target, pages)
+            # the copy has the journal mode of the database, a backup in the write ahead log
+            # would get -wal and -shm files next to it whenever it is opened
+            target.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            target.close()
+            if not in_memory():
+                source.close()
+        if compress:
+            with open(temporary, "rb") as plain, gzip.open(temporary + ".gz", "wb") as packed:
+                shutil.copyfileobj(plain, packed)
+            os.remove(temporary)
+            temporary += ".gz"
+        os.replace(temporary, path)
+    except BaseException:
+        for leftover in (temporary, temporary + ".gz"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+    if prune:
+        prune_backups(directory)
+    return path
+
+
+def list_backups(directory=None):
+    """Return (time, path) of every backup in the directory, newest first"""
+    directory = directory or backup_directory()
+    backups = []
+    for name in os.listdir(directory):
+        match = BACKUP_NAME.match(name)
+        if match:
+            created = datetime.datetime.strptime(match.group(1), TIME_FORMAT)
+            backups.append((created, directory + os.sep + name))
+    return sorted(backups, reverse=True)
+
+
+def prune_backups(directory=None, keep_daily=None, keep_weekly=None, today=None):
+    """Keep every backup of today, of the days before the newest backup of each of the last
+    keep_daily days and keep_weekly weeks that have backups, remove all others.
+    Return the paths of the removed backups"""
+    today = today or datetime.date.today()
+    if keep_daily is None:
+        keep_daily = int(models.SETTINGS["backup_keep_daily"])
+    if keep_weekly is None:
+        keep_weekly = int(models.SETTINGS["backup_keep_weekly"])
+    backups = list_backups(directory)
+    # a backup made earlier today is kept, a second backup of the day doesn't replace it
+    keep = {path for created, path in backups if created.date() >= today}
+    days = {}
+    weeks = {}
+    for created, path in backups:  # newest first, so the first one of a day or week is kept
+        days.setdefault(created.date(), path)
+        weeks.setdefault(created.isocalendar()[:2], path)
+    keep.update(list(days.values())[:keep_daily])
+    keep.update(list(weeks.values())[:keep_weekly])
+    removed = [path for _, path in backups if path not in keep]
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def open_backup(path):
+    """Return a sqlite3 connection to a backup, compressed backups are unpacked into memory"""
+    if not path.endswith(".gz"):
+        # immutable: nothing writes to a backup, so sqlite needs no lock or -shm file for it
+        return sqlite3.connect(f"file:{path}?mode=ro&immutable=1", uri=True)
+    with tempfile.TemporaryDirectory() as directory:
+        plain = directory + os.sep + "backup.db"
+        with gzip.open(path, "rb") as packed, open(plain, "wb") as file:
+            shutil.copyfileobj(packed, file)
+        source = sqlite3.connect(plain)
+        connection = sqlite3.connect(":memory:")
+        try:
+            copy_database(source, connection, -1)
+        finally:
+            source.close()
+    return connection
+
+
+def verify_backup(path):
+    """Check a backup, return None if it is fine or a message what is wrong with it"""
+    try:
+        connection = open_backup(path)
+    except (OSError, EOFError, sqlite3.Error) as error:
+        return f"can't be read: {error}"
+    try:
+        result = connection.execute("PRAGMA integrity_check").fetchone()[0]
+        if result != "ok":
+            return f"is damaged: {result}"
+        tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master")}
+        missing = {"skills", "entries"} - tables
+        if missing:
+            return f"is not a LevelUp database, it has no {', '.join(sorted(missing))} table"
+    except sqlite3.Error as error:
+        return f"is damaged: {error}"
+    finally:
+        connection.close()
+    return None
+
+
+def restore_backup(path):
+    """Replace the database with a backup, after checking it and backing up the current state.
+    Return the path of the backup of the current state"""
+    problem = verify_backup(path)
+    if problem:
+        raise ValueError(f"The backup {path} {problem}")
+    # next to the backup, without pruning, that could remove the backup to restore
+    safety = create_backup(os.path.dirname(os.path.abspath(path)), prune=False)
+    source = open_backup(path)
+    try:
+        models.session.commit()
+        before = models.read_data_version()
+        copy_database(source, raw_connection())
+    finally:
+        source.close()
+    models.session.expire_all()  # the skills in the session are from before the restore
+    # an older backup may need the newer tables
+    from migrations import migrate
+
+    migrate(models.get_engine())
+    # the data version of the backup can be one that other processes already saw with other data
+    version = max(before, models.read_data_version()) + 1
+    models.session.execute(models.SET_DATA_VERSION, {"version": version})
+    models.session.commit()
+    bump(version=version)  # every cached series, stats and level is from before the restore
+    return safety
@@ -0,0 +1,597 @@
+# Benchmarks for LevelUp, run them with: python benchmark.py <benchmark>
+# Every benchmark works on scratch databases, the real database is never touched
+
+import argparse
+import collections
+import datetime
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import models
+from migrations import migrate
+
+
+def time_calls(function, repeat):
+    """Call the function repeat times, return the list of durations in milliseconds"""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def percentile(durations, percent):
+    """Return the percentile of a list of durations"""
+    durations = sorted(durations)
+    return durations[min(int(len(durations) * percent / 100), len(durations) - 1)]
+
+
+def summary(durations):
+    """Return the p50 and p99 of a list of durations as a string"""
+    return f"p50 {statistics.median(durations):7.3f} ms  p99 {percentile(durations, 99):7.3f} ms"
+
+
+def scratch_database(directory, profile=None, name="bench.db"):
+    """Point the models to a new database in the directory and create the tables"""
+    models.configure_storage("sqlite:///" + directory + os.sep + name, profile)
+    migrate(models.get_engine())
+
+
+def add_history(skillname, days, minutes=30):
+    """Add a skill with an entry for every one of the last days"""
+    models.session.add(models.Skill(name=skillname))
+    today = datetime.date.today()
+    entries = [
+        {
+            "skill": skillname,
+            "date": today - datetime.timedelta(days=day),
+            "minutes": minutes,
+        }
+        for day in range(1, days + 1)
+    ]
+    models.session.execute(models.UPSERT_ENTRY, entries)
+    models.add_to_rollups(entries)
+    models.session.commit()
+    models.rebuild_totals()
+
+
+def generate_history(skills, years, sparsity=0.3, goals=(0, 15, 30, 60), seed=0):
+    """Fill the database with skills that have years of daily entries up to yesterday.
+    A part of the days (the sparsity) has no practice, the others get minutes around the
+    daily goal of the skill, which is picked from the goals. Return the names of the skills"""
+    generator = random.Random(seed)
+    today = datetime.date.today()
+    days = int(years * 365)
+    skill_list = []
+    for skill in range(skills):
+        skillname = f"Skill{skill}"
+        goal = generator.choice(goals)
+        models.session.add(models.Skill(name=skillname, daily_goal=goal))
+        skill_list.append(skillname)
+        entries = [
+            {
+                "skill": skillname,
+                "date": today - datetime.timedelta(days=day),
+                "minutes": max(1, int(generator.gauss(goal or 30, 15))),
+            }
+            for day in range(1, days + 1)
+            if generator.random() >= sparsity
+        ]
+        models.session.execute(models.UPSERT_ENTRY, entries)
+        models.session.commit()
+    # totals, levels and rollups in one go, faster than adding to them for every entry
+    models.rebuild_totals()
+    models.rebuild_rollups()
+    return skill_list
+
+
+def bench_profiles(writes, reads, days):
+    """Write and read latency of the models for every pragma profile"""
+    print(f"{writes} logs and {reads} reads of a skill with {days} days of history\n")
+    for profile in models.PRAGMA_PROFILES:
+        with tempfile.TemporaryDirectory() as directory:
+            scratch_database(directory, profile)
+            add_history("Benchmark", days)
+            write = time_calls(lambda: models.log_minutes("Benchmark", 1), writes)
+            read = time_calls(
+                lambda: (  # past the cache, the reads go to the database
+                    models.get_dates_and_hours.__wrapped__(["Benchmark"]),
+                    models.get_stats.__wrapped__(["Benchmark"]),
+                ),
+                reads,
+            )
+            print(f"{profile:<12} write: {summary(write)}   read: {summary(read)}")
+            models.configure_storage()  # close the scratch database
+
+
+def bench_import(rows, skills, file_format, batch_size):
+    """Time importing a generated file with rows entries spread over the skills"""
+    from importer import import_entries
+
+    with tempfile.TemporaryDirectory() as directory:
+        scratch_database(directory)
+        path = directory + os.sep + "entries." + file_format
+        first_day = datetime.date.today() - datetime.timedelta(days=rows // skills)
+        with open(path, "w") as file:
+            if file_format == "csv":
+                file.write("skill,date,minutes\n")
+            elif file_format == "json":
+                file.write("[\n")
+            for row in range(rows):
+                day = first_day + datetime.timedelta(days=row // skills)
+                line = (f"Skill{row % skills}", day.isoformat(), row % 120)
+                if file_format == "csv":
+                    file.write("%s,%s,%d\n" % line)
+                else:
+                    separator = "," if file_format == "json" and row else ""
+                    entry = dict(zip(("skill", "date", "minutes"), line))
+                    file.write(separator + json.dumps(entry) + "\n")
+            if file_format == "json":
+                file.write("]\n")
+        start = time.perf_counter()
+        imported, skipped = import_entries(path, batch_size=batch_size, progress=False)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{file_format}: imported {imported} rows ({len(skipped)} skipped) "
+            f"in {elapsed:.2f} s, {imported / elapsed:,.0f} rows/s"
+        )
+        models.configure_storage()  # close the scratch database
+
+
+def bench_render(skills, days, workers):
+    """Time rendering every range of every skill, drawn in a pool of processes and from the cache"""
+    from render import RANGES, render_all
+
+    with tempfile.TemporaryDirectory() as directory:
+        scratch_database(directory)
+        for skill in range(skills):
+            add_history(f"Skill{skill}", days, minutes=skill + 1)
+        graphs = directory + os.sep + "graphs"
+        for run in ("drawn", "cached"):
+            start = time.perf_counter()
+            results = render_all(graphs, workers=workers)
+            elapsed = time.perf_counter() - start
+            assert len(results) == skills * len(RANGES)
+            assert all(cached == (run == "cached") for *_, cached in results)
+            assert all(os.path.getsize(path) > 0 for *_, path, _ in results)
+            print(f"{run:<8}{len(results)} graphs in {elapsed:.2f} s")
+        models.configure_storage()  # close the scratch database
+
+
+def bench_insights(skills, days, views):
+    """Latency and sql statements of repeated insight views, with and without the cache"""
+    from sqlalchemy import event
+
+    from cache import CACHE
+    from instrument import action
+
+    with tempfile.TemporaryDirectory() as directory:
+        scratch_database(directory)
+        skill_list = [f"Skill{skill}" for skill in range(skills)]
+        for skillname in skill_list:
+            add_history(skillname, days)
+        statements = []
+        event.listen(
+            models.get_engine(), "before_cursor_execute", lambda *_: statements.append(1)
+        )
+
+        def view():
+            with action("insights"):  # like a visit of the insight menu
+                models.get_stats(skill_list)
+                models.get_rollup_series(skill_list, "week")
+                models.get_dates_and_hours(skill_list)
+                models.get_level(skill_list[0])
+
+        for cache_size in (0, CACHE.max_size):
+            CACHE.max_size = cache_size
+            CACHE.clear()
+            statements.clear()
+            durations = time_calls(view, views)
+            print(
+                f"cache size {cache_size:<5} {summary(durations)}   "
+                f"{len(statements) / views:.1f} sql statements per view"
+            )
+        print(CACHE.counters())
+        models.configure_storage()  # close the scratch database
+
+
+def bench_memory(skills, days):
+    """Memory of the daily series of the skills, as lists, as numpy arrays and as SkillSeries"""
+    import tracemalloc
+
+    import numpy as np
+
+    today = datetime.date.today()
+    rows = [
+        (f"Skill{skill}", 30, today - datetime.timedelta(days=day), (day * 7 + skill) % 120)
+        for skill in range(skills)
+        for day in range(days, 0, -1)
+    ]
+
+    def as_lists():
+        # a date and an int object for every day, like the series before numpy,
+        # new date objects like the ones of a query
+        return {
+            name: {
+                "dates": [
+                    datetime.date.fromordinal(row[2].toordinal()) for row in rows if row[0] == name
+                ],
+                "minutes": [row[3] for row in rows if row[0] == name],
+                "goal": 30,
+            }
+            for name in {row[0] for row in rows}
+        }
+
+    def as_arrays():
+        # a datetime64 and an int32 for every day
+        return {
+            name: {
+                "dates": np.array(series.dates),
+                "minutes": series.minutes.astype(np.int32),
+                "goal": series.goal,
+            }
+            for name, series in models.split_series(rows).items()
+        }
+
+    models.split_series(rows)  # numpy and series.py are loaded before measuring
+    print(f"{skills} skills with {days} days each\n")
+    for name, build in (
+        ("lists", as_lists),
+        ("numpy arrays", as_arrays),
+        ("SkillSeries", lambda: models.split_series(rows)),
+    ):
+        tracemalloc.start()
+        payload = build()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del payload
+        per_days = size / (skills * days) * 10000
+        print(f"{name:<14}{size / 1024:>10,.0f} KiB  {per_days / 1024:>8,.1f} KiB per 10k days")
+
+
+def stress_worker(url, profile, logs, skills, seed):
+    """Log random minutes to random skills and days, return the sums that were logged"""
+    models.configure_storage(url, profile)
+    generator = random.Random(seed)
+    today = datetime.date.today()
+    logged = collections.Counter()
+    for _ in range(logs):
+        skillname = f"Skill{generator.randrange(skills)}"
+        day = today - datetime.timedelta(days=generator.randrange(10))
+        minutes = generator.randint(1, 60)
+        models.log_minutes(skillname, minutes, day)
+        logged[(skillname, day.isoformat())] += minutes
+    models.configure_storage()  # close the connections of this process
+    return logged
+
+
+def bench_stress(processes, logs, skills, profile):
+    """Log from many processes at once and check that no minutes were lost"""
+    with tempfile.TemporaryDirectory() as directory:
+        scratch_database(directory, profile)
+        for skill in range(skills):
+            models.session.add(models.Skill(name=f"Skill{skill}"))
+        models.session.commit()
+        url = models.DATABASE_URL
+        models.configure_storage()  # the workers open their own connections
+        start = time.perf_counter()
+        # spawned, so no process inherits the connections of another one
+        with multiprocessing.get_context("spawn").Pool(processes) as pool:
+            results = pool.starmap(
+                stress_worker,
+                [(url, profile, logs, skills, seed) for seed in range(processes)],
+            )
+        elapsed = time.perf_counter() - start
+        expected = sum(results, collections.Counter())
+        models.configure_storage(url, profile)
+        stored = collections.Counter(
+            {
+                (skill, str(date)): minutes
+                for skill, date, minutes in models.session.execute(
+                    "SELECT skill, date, minutes FROM entries WHERE minutes != 0"
+                )
+            }
+        )
+        levels = all(
+            models.calculate_level(skill.total_minutes)[::2] == (skill.current_level, skill.xp_points)
+            for skill in models.session.query(models.Skill)
+        )
+        weekly = set(map(tuple, models.session.execute("SELECT * FROM skill_weekly")))
+        models.rebuild_rollups()
+        checks = {
+            "entries match the logged minutes": stored == expected,
+            "totals match the entries": not models.check_totals(),
+            "levels match the totals": levels,
+            "streaks match the entries": not models.check_streaks(),
+            "rollups match the entries": weekly
+            == set(map(tuple, models.session.execute("SELECT * FROM skill_weekly"))),
+        }
+        print(
+            f"{processes} processes logged {processes * logs} times in {elapsed:.2f} s, "
+            f"{processes * logs / elapsed:.0f} logs/s"
+        )
+        for check, ok in checks.items():
+            print(f"{check}: {'yes' if ok else 'NO'}")
+        models.configure_storage()  # close the scratch database
+        if not all(checks.values()):
+            raise SystemExit("Minutes were lost or counted twice.")
+
+
+def parse_size(value):
+    """Parse a data size given as SKILLSxYEARS, like 5x3"""
+    try:
+        skills, years = value.lower().split("x")
+        return int(skills), float(years)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value} is not a size like 5x3 (skills x years)")
+
+
+def time_startup(url, skillname, repeat):
+    """Time starting the program to print the level of a skill, imports and database setup included"""
+    import subprocess
+    import sys
+
+    environment = dict(os.environ, LVLUP_DATABASE_URL=url)
+    command = [sys.executable, os.path.join(os.path.dirname(__file__) or ".", "main.py")]
+    return time_calls(
+        lambda: subprocess.run(
+            command + ["level", skillname], env=environment, check=True, capture_output=True
+        ),
+        repeat,
+    )
+
+
+def suite_size(directory, skills, years, sparsity, repeat):
+    """Run every timing of the suite on a generated database, return {name: durations}"""
+    from instrument import action
+    from render import draw, get_series
+
+    scratch_database(directory, name=f"suite-{skills}x{years}.db")
+    skill_list = generate_history(skills, years, sparsity)
+    first = skill_list[0]
+    timings = {}
+
+    def time_model(name, function):
+        """Time a function of the models, instrument.py counts its statements and commits"""
+        with action(name):
+            timings[name] = time_calls(function, repeat)
+
+    # past the cache, every read goes to the database
+    time_model("get_dates_and_hours", lambda: models.get_dates_and_hours.__wrapped__(skill_list))
+    time_model(
+        "get_rollup_series", lambda: models.get_rollup_series.__wrapped__(skill_list, "week")
+    )
+    time_model("get_stats", lambda: models.get_stats.__wrapped__(skill_list))
+    time_model("get_level", lambda: models.get_level.__wrapped__(first))
+    # any range from the prefix sums, the index is built at the first call
+    from ranges import range_stats
+
+    today = datetime.date.today()
+    time_model(
+        "range_stats",
+        lambda: range_stats(skill_list, today - datetime.timedelta(days=int(years * 365)), today),
+    )
+    time_model("log_minutes", lambda: models.log_minutes(first, 1))
+    timings["startup"] = time_startup(models.DATABASE_URL, first, max(1, repeat // 10))
+    # xkcd style like in the menu, a few times only, one graph takes a good part of a second
+    graphs = directory + os.sep + "graphs"
+    os.makedirs(graphs, exist_ok=True)
+    for range_name in ("all", "week"):
+        series = get_series([first], range_name)
+        path = graphs + os.sep + f"{range_name}-x.png"
+        draw(series, range_name, path, "xkcd")  # the first graph also loads the fonts
+        timings[f"render_{range_name}"] = time_calls(
+            lambda: draw(series, range_name, path, "xkcd"), max(3, repeat // 20)
+        )
+    # with dense entries the first log of a run fills the 0 days of the whole history,
+    # last because it adds rows for every day
+    sparse = models.SPARSE_ENTRIES
+    models.SPARSE_ENTRIES = False
+    try:
+
+        def fill():
+            # like the first log in dense mode, every day is checked again
+            models.session.query(models.FilledDays).delete()
+            models.Entry.add_null_date(first)
+
+        time_model("add_null_date", fill)
+    finally:
+        models.SPARSE_ENTRIES = sparse
+    models.configure_storage()  # close the scratch database
+    return timings
+
+
+def bench_suite(sizes, sparsity, repeat, output):
+    """Time the model functions, the log path, startup and rendering at every data size.
+    Print the results and write them to the output as json"""
+    import platform
+
+    import sqlalchemy
+
+    import instrument
+
+    instrument.enable(report=False)  # counts the sql of the model functions
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for skills, years in sizes:
+            size = f"{skills}x{years:g}"
+            print(f"\n{skills} skills with {years:g} years of entries")
+            instrument.reset()
+            timings = suite_size(directory, skills, years, sparsity, repeat)
+            counted = instrument.counters()["actions"]
+            results[size] = {}
+            for name, durations in timings.items():
+                result = {
+                    "p50": statistics.median(durations),
+                    "p99": percentile(durations, 99),
+                    "runs": len(durations),
+                }
+                line = f"  {name:<22}{summary(durations)}"
+                if name in counted:
+                    result["statements"] = counted[name]["statements"] / len(durations)
+                    result["commits"] = counted[name]["commits"] / len(durations)
+                    line += f"  {result['statements']:5.1f} sql {result['commits']:4.1f} commits"
+                print(line)
+                results[size][name] = result
+    report = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlalchemy": sqlalchemy.__version__,
+        "machine": platform.machine(),
+        "profile": models.PROFILE,
+        "sparse_entries": models.SPARSE_ENTRIES,
+        "sparsity": sparsity,
+        "results": results,
+    }
+    if output:
+        with open(output, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"\nResults written to {output}")
+    return report
+
+
+def compare(baseline, current, threshold, minimum):
+    """Print the p50 of every timing against the baseline, return the timings that got slower
+    by more than the threshold (0.2 is 20%) and more than minimum milliseconds"""
+    with open(baseline) as file:
+        before = json.load(file)["results"]
+    with open(current) as file:
+        after = json.load(file)["results"]
+    regressions = []
+    print(f"{'size':<8}{'timing':<22}{'baseline':>12}{'current':>12}{'change':>9}")
+    for size, timings in after.items():
+        for name, result in timings.items():
+            if name not in before.get(size, {}):
+                continue  # a new timing, there is nothing to compare with
+            old, new = before[size][name]["p50"], result["p50"]
+            change = (new - old) / old if old else 0
+            slower = change > threshold and new - old > minimum
+            if slower:
+                regressions.append((size, name, old, new))
+            print(
+                f"{size:<8}{name:<22}{old:>9.3f} ms{new:>9.3f} ms{change:>+8.0%}"
+                + ("  SLOWER" if slower else "")
+            )
+    return regressions
+
+
+def parse_args():
+    """Parse the benchmark to run and its options"""
+    parser = argparse.ArgumentParser(description="Benchmarks for LevelUp")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    profiles = subparsers.add_parser(
+        "profiles", help="write and read latency for every storage profile"
+    )
+    profiles.add_argument("--writes", type=int, default=200)
+    profiles.add_argument("--reads", type=int, default=200)
+    profiles.add_argument("--days", type=int, default=3 * 365)
+    import_parser = subparsers.add_parser(
+        "import", help="time importing a generated file"
+    )
+    import_parser.add_argument("--rows", type=int, default=1000000)
+    import_parser.add_argument("--skills", type=int, default=20)
+    import_parser.add_argument(
+        "--format", choices=["json", "ndjson", "csv"], default="ndjson"
+    )
+    import_parser.add_argument("--batch-size", type=int, default=10000)
+    render = subparsers.add_parser(
+        "render", help="render the graphs of many skills to files, then again from the cache"
+    )
+    render.add_argument("--skills", type=int, default=50)
+    render.add_argument("--days", type=int, default=365)
+    render.add_argument("--workers", type=int, help="default one process per cpu")
+    insights = subparsers.add_parser(
+        "insights", help="repeated insight views with and without the cache"
+    )
+    insights.add_argument("--skills", type=int, default=5)
+    insights.add_argument("--days", type=int, default=3 * 365)
+    insights.add_argument("--views", type=int, default=100)
+    memory = subparsers.add_parser(
+        "memory", help="memory of the daily series as lists, numpy arrays and SkillSeries"
+    )
+    memory.add_argument("--skills", type=int, default=10)
+    memory.add_argument("--days", type=int, default=10000)
+    stress = subparsers.add_parser(
+        "stress", help="log from many processes at once and check that nothing was lost"
+    )
+    stress.add_argument("--processes", type=int, default=8)
+    stress.add_argument("--logs", type=int, default=200, help="logs of every process")
+    stress.add_argument("--skills", type=int, default=3)
+    stress.add_argument("--profile", default="performance")
+    suite = subparsers.add_parser(
+        "suite", help="time every model function, startup and rendering at several data sizes"
+    )
+    suite.add_argument(
+        "--sizes",
+        type=parse_size,
+        nargs="+",
+        default=[(1, 1), (5, 3), (20, 10)],
+        help="skills x years, default 1x1 5x3 20x10",
+    )
+    suite.add_argument("--sparsity", type=float, default=0.3, help="part of the days without entries")
+    suite.add_argument("--repeat", type=int, default=50)
+    suite.add_argument("-o", "--output", help="json file for the results")
+    suite.add_argument("--baseline", help="compare with the results of an earlier run")
+    suite.add_argument("--threshold", type=float, default=0.2, help="slower than this is a regression")
+    compare_parser = subparsers.add_parser(
+        "compare", help="compare two json results of the suite, fails if something got slower"
+    )
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.2, help="0.2 is 20% slower")
+    compare_parser.add_argument(
+        "--minimum", type=float, default=0.5, help="milliseconds slower that are still noise"
+    )
+    generate = subparsers.add_parser(
+        "generate", help="write a database with a generated history, to try things by hand"
+    )
+    generate.add_argument("path")
+    generate.add_argument("--skills", type=int, default=5)
+    generate.add_argument("--years", type=float, default=3)
+    generate.add_argument("--sparsity", type=float, default=0.3)
+    return parser.parse_args()
+
+
+def fail_on_regressions(regressions):
+    """Exit with an error if a timing got slower"""
+    if regressions:
+        raise SystemExit(f"\n{len(regressions)} timings got slower than the baseline.")
+    print("\nNothing got slower than the baseline.")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.benchmark == "profiles":
+        bench_profiles(args.writes, args.reads, args.days)
+    elif args.benchmark == "import":
+        bench_import(args.rows, args.skills, args.format, args.batch_size)
+    elif args.benchmark == "render":
+        bench_render(args.skills, args.days, args.workers)
+    elif args.benchmark == "insights":
+        bench_insights(args.skills, args.days, args.views)
+    elif args.benchmark == "memory":
+        bench_memory(args.skills, args.days)
+    elif args.benchmark == "stress":
+        bench_stress(args.processes, args.logs, args.skills, args.profile)
+    elif args.benchmark == "suite":
+        bench_suite(args.sizes, args.sparsity, args.repeat, args.output)
+        if args.baseline:
+            if not args.output:
+                raise SystemExit("Give the results a file with -o to compare them.")
+            print()
+            fail_on_regressions(compare(args.baseline, args.output, args.threshold, 0.5))
+    elif args.benchmark == "compare":
+        fail_on_regressions(compare(args.baseline, args.current, args.threshold, args.minimum))
+    elif args.benchmark == "generate":
+        if os.path.exists(args.path):
+            raise SystemExit(f"{args.path} already exists, the generator only writes new databases.")
+        directory, name = os.path.split(os.path.abspath(args.path))
+        scratch_database(directory, name=name)
+        skill_list = generate_history(args.skills, args.years, args.sparsity)
+        print(f"{len(skill_list)} skills with {args.years:g} years of entries in {args.path}")
@@ -0,0 +1,136 @@
+# Cache for the data derived from the database: series, stats and levels of the skills
+# Every skill has a version that goes up with every write, cached data of an older version is never used
+# Writes of other processes (another terminal, a script, the server) are noticed with the data version
+# of the database, a counter that goes up with every write, see models.count_write. It is read once
+# at the start of every user action (instrument.action) and request of the server, see check
+
+import collections
+import datetime
+import functools
+import threading
+
+# write version of every skill, see bump
+VERSIONS = collections.Counter()
+# goes up for writes that touch every skill, like imports and restores
+GENERATION = 0
+# called with (skill name, date, minutes) after minutes were logged, to update data in place
+LOG_LISTENERS = []
+# data version of the database when this process last looked, see seen
+SEEN = None
+# reads the data version of the database and passes it to seen, set by models.py
+VERSION_CHECK = None
+SEEN_LOCK = threading.Lock()
+
+
+class LRUCache:
+    """Dictionary with a size cap, the least recently used item is removed first"""
+
+    def __init__(self, max_size=128):
+        self.max_size = max_size
+        self.items = collections.OrderedDict()
+        self.lock = threading.Lock()  # the server reads from several threads
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Return the item of the key and mark it as used, count a hit or a miss"""
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return self.items[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        """Add an item, remove the least recently used one if the cache is full"""
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Remove all items, the counters stay"""
+        with self.lock:
+            self.items.clear()
+
+    def counters(self):
+        """Return hits, misses, evictions and size as a dictionary"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self.items),
+            "max_size": self.max_size,
+        }
+
+
+CACHE = LRUCache()
+
+
+def seen(version, written=False):
+    """Compare the data version of the database with the one this process saw last.
+    written: the version comes from a write of this process, which counted once.
+    Return True if another process wrote in between, then every skill is marked as changed"""
+    global SEEN
+    with SEEN_LOCK:
+        other = (version - 1 if written else version) != SEEN
+        SEEN = version if SEEN is None else max(SEEN, version)
+    if other:
+        bump()
+    return other
+
+
+def check():
+    """Look for writes of other processes, before the cached data of an action is used"""
+    if VERSION_CHECK is not None:
+        VERSION_CHECK()
+
+
+def bump(skillnames=None, version=None):
+    """Mark skills as changed, without names every skill.
+    version: the data version of the database after the write, see seen"""
+    global GENERATION
+    if version is not None:
+        seen(version, written=True)
+    if skillnames is None:
+        GENERATION += 1
+    else:
+        VERSIONS.update([skillnames] if isinstance(skillnames, str) else skillnames)
+
+
+def logged(skillname, date, minutes, version=None):
+    """Mark a skill as changed by a log, then tell the listeners, see ranges.py"""
+    bump(skillname, version)
+    for listener in LOG_LISTENERS:
+        listener(skillname, date, minutes)
+
+
+def memoize(function):
+    """Cache the results of a function whose first argument is a skill name or a list of them.
+    The results are shared, callers must not change them"""
+    missing = object()
+
+    @functools.wraps(function)
+    def cached(skills, *args, **options):
+        names = (skills,) if isinstance(skills, str) else tuple(skills)
+        # series and stats are counted up to today, so they change with the date as well
+        key = (
+            function.__name__,
+            names,
+            args,
+            tuple(sorted(options.items())),
+            tuple(VERSIONS[name] for name in names),
+            GENERATION,
+            datetime.date.today(),
+        )
+        result = CACHE.get(key, missing)
+        if result is missing:
+            result = function(skills, *args, **options)
+            CACHE.put(key, result)
+        return result
+
+    return cached
@@ -0,0 +1,437 @@
+# Command line interface: subcommands to log and report without the menues
+# Only the modules a command needs are imported, never inquirer or matplotlib
+
+import argparse
+import datetime
+import importlib
+import json
+import sys
+import time
+
+# modules of the program in the order they are loaded, for --profile-startup
+STARTUP_MODULES = [
+    "config", "cache", "levels", "models", "instrument", "migrations", "output", "menues", "graphs"
+]
+
+
+def prepare_database():
+    """Create the tables or upgrade an existing database"""
+    from migrations import migrate
+    from models import get_engine
+
+    try:
+        engine = get_engine()
+    except ValueError as error:  # a wrong database_url or profile in the settings
+        sys.exit(str(error))
+    migrate(engine)
+
+
+def start_tracing(args):
+    """Switch the instrumentation on with --trace, LVLUP_TRACE=yes works without it"""
+    if args.trace:
+        import instrument
+
+        instrument.enable()
+
+
+def profile_startup():
+    """Load every module of the program and set up the database,
+    print how long each step took and how many modules it imported"""
+    print(f"{'step':<12}{'time':>10}{'modules':>10}")
+    total = 0
+    for module in STARTUP_MODULES + ["database"]:
+        loaded = len(sys.modules)
+        start = time.perf_counter()
+        if module == "database":
+            prepare_database()
+        else:
+            importlib.import_module(module)
+        elapsed = (time.perf_counter() - start) * 1000
+        total += elapsed
+        print(f"{module:<12}{elapsed:>8.1f}ms{len(sys.modules) - loaded:>10}")
+    print(f"{'total':<12}{total:>8.1f}ms")
+
+
+def skill_argument(skillname):
+    """Return the stored name of a skill given on the command line, exit if it doesn't exist"""
+    from models import find_skill
+
+    name = find_skill(skillname)
+    if name is None:
+        sys.exit(f"There is no skill {skillname}, add it in the settings menu first.")
+    return name
+
+
+def date_argument(value):
+    """Parse a date given as YYYY-MM-DD"""
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{value} is not a date (YYYY-MM-DD)")
+
+
+def log_date_argument(value):
+    """Parse the day of a log, minutes can't be logged for days that haven't come yet"""
+    date = date_argument(value)
+    if date > datetime.date.today():
+        raise argparse.ArgumentTypeError(f"{value} is in the future")
+    return date
+
+
+def minutes_argument(value):
+    """Parse minutes, only integers of 0 and above"""
+    if not value.isdigit():
+        raise argparse.ArgumentTypeError("Enter an integer of 0 or more.")
+    return int(value)
+
+
+def print_json(data):
+    """Print data as json, dates are written as YYYY-MM-DD"""
+    print(json.dumps(data, indent=2, default=str))
+
+
+def log_command(args):
+    """Add minutes to a skill and print the new level"""
+    from models import log_minutes
+
+    summary = log_minutes(skill_argument(args.skill), args.minutes, args.date)
+    day = f"on {args.date}" if args.date else "today"
+    print(
+        f"{summary.skill}: {summary.minutes_invested} minutes {day}, "
+        f"level {summary.current_level}, {summary.xp_required} hours to level {summary.next_level}, "
+        f"{summary.current_streak} day streak"
+    )
+
+
+def stats_command(args):
+    """Print the weekly and monthly stats of the skills"""
+    from models import get_skill_names, get_stats
+    from output import show_stats
+
+    skill_list = [skill_argument(name) for name in args.skills] or get_skill_names()
+    if args.start or args.stop:
+        # any range, from the prefix sums of ranges.py
+        from output import show_range_stats
+        from ranges import range_stats
+
+        today = datetime.date.today()
+        first, last = args.start or today.replace(month=1, day=1), args.stop or today
+        if last < first:
+            sys.exit(f"The range ends on {last}, before its first day {first}.")
+        stats_dict = range_stats(skill_list, first, last)
+        show = show_range_stats
+    else:
+        stats_dict = get_stats(skill_list)
+        show = show_stats
+    if args.json:
+        print_json(stats_dict)
+    else:
+        print(show(stats_dict))
+
+
+def level_command(args):
+    """Print level, xp and goal of a skill"""
+    from models import get_level
+
+    skillname = skill_argument(args.skill)
+    current_level, next_level, xp_points, xp_required, total_minutes, goal = get_level(
+        skillname
+    )
+    level = {
+        "skill": skillname,
+        "level": current_level,
+        "next_level": next_level,
+        "xp_points": xp_points,
+        "xp_required": xp_required,
+        "total_hours": round(total_minutes / 60, 2),
+        "daily_goal": goal,
+    }
+    if args.json:
+        print_json(level)
+    else:
+        print(
+            f"{skillname}: level {current_level}, {xp_points} hours xp, "
+            f"{xp_required} hours to level {next_level} "
+            f"({level['total_hours']} hours in total)"
+        )
+
+
+def export_command(args):
+    """Write the entries or skills as json, ndjson or csv"""
+    from exporter import export_table
+
+    count = export_table(
+        args.table,
+        args.output,
+        args.format,
+        skill_argument(args.skill) if args.skill else None,
+        args.start,
+        args.stop,
+        args.gzip or None,
+    )
+    if args.output:
+        print(f"Exported {count} {args.table} to {args.output}.")
+
+
+def import_command(args):
+    """Import entries or skills from a json, ndjson or csv file"""
+    from importer import import_entries, import_skills
+
+    if args.table == "skills":
+        imported, skipped = import_skills(args.file, args.format)
+    else:
+        imported, skipped = import_entries(
+            args.file, args.format, args.batch_size, args.mode, not args.quiet
+        )
+    for number, error in skipped[:10]:
+        print(f"Skipped row {number}: {error}", file=sys.stderr)
+    if len(skipped) > 10:
+        print(f"... and {len(skipped) - 10} more", file=sys.stderr)
+    print(f"Imported {imported} {args.table}, skipped {len(skipped)} rows.")
+
+
+def compact_command(args):
+    """Remove the 0 days from the database"""
+    from models import compact_entries
+
+    print(f"Removed {compact_entries()} empty days from the database.")
+
+
+def rebuild_totals_command(args):
+    """Recompute (or only check) the totals of every skill and print the drift"""
+    from models import check_totals, rebuild_totals
+
+    drift = check_totals() if args.check else rebuild_totals()
+    for skillname, (stored, actual) in drift.items():
+        print(f"{skillname}: stored {stored} minutes, entries add up to {actual} minutes")
+    if not drift:
+        print("All totals match their entries.")
+
+
+def rebuild_rollups_command(args):
+    """Recompute the weekly and monthly rollups"""
+    from models import rebuild_rollups
+
+    rebuild_rollups()
+    print("Rebuilt the weekly and monthly totals.")
+
+
+def rebuild_streaks_command(args):
+    """Recompute (or only check) the streaks of every skill and print the drift"""
+    from models import check_streaks, rebuild_streaks
+
+    drift = check_streaks() if args.check else rebuild_streaks()
+    for skillname, (saved, computed) in drift.items():
+        for field, value in saved._asdict().items():
+            should_be = getattr(computed, field, None)  # a skill without entries has no streaks
+            if value != should_be:
+                print(f"{skillname}: saved {field} {value}, entries give {should_be}")
+    if not drift:
+        print("All streaks match their entries.")
+
+
+def render_command(args):
+    """Write graphs of the skills to png or svg files"""
+    from render import RANGES, render_all, render_graphs
+
+    ranges = args.range or list(RANGES)
+    if args.skills:
+        skill_list = [skill_argument(name) for name in args.skills]
+        jobs = [(skill_list, range_name) for range_name in ranges]
+        results = render_graphs(jobs, args.output_dir, args.format, args.style, args.workers)
+    else:
+        results = render_all(args.output_dir, args.format, args.style, args.workers, ranges)
+    for skill_list, range_name, path, cached in results:
+        print(f"{', '.join(skill_list)} ({range_name}): {path}{' (cached)' if cached else ''}")
+
+
+def serve_command(args):
+    """Run the HTTP/JSON api"""
+    from server import serve
+
+    serve(args.host, args.port, args.readers)
+
+
+def backup_command(args):
+    """Create, list, verify or restore backups"""
+    import backup
+
+    if args.action == "create":
+        compress = False if args.no_compress else None
+        print(f"Backup created at {backup.create_backup(args.directory, compress)}")
+    elif args.action == "list":
+        for created, path in backup.list_backups(args.directory):
+            print(f"{created:%Y-%m-%d %H:%M:%S}  {path}")
+    elif args.action == "prune":
+        for path in backup.prune_backups(args.directory):
+            print(f"Removed {path}")
+    elif args.action == "verify":
+        problem = backup.verify_backup(args.file)
+        if problem:
+            sys.exit(f"The backup {args.file} {problem}")
+        print(f"The backup {args.file} is fine.")
+    elif args.action == "restore":
+        try:
+            safety = backup.restore_backup(args.file)
+        except ValueError as error:
+            sys.exit(str(error))
+        print(f"Restored {args.file}, the database before is backed up at {safety}")
+
+
+def parse_args():
+    """Parse the command line, without a command the menu is started"""
+    parser = argparse.ArgumentParser(description="Gamify your learning process")
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="print how long loading each part of the program takes",
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="print the sql statements, commits and time of every action, like LVLUP_TRACE=yes",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+
+    log = subparsers.add_parser("log", help="add minutes to a skill")
+    log.add_argument("skill")
+    log.add_argument("minutes", type=minutes_argument)
+    log.add_argument(
+        "--date", type=log_date_argument, help="day of the minutes, default today"
+    )
+    log.set_defaults(function=log_command)
+
+    stats = subparsers.add_parser("stats", help="weekly and monthly stats")
+    stats.add_argument("skills", nargs="*", help="default all skills")
+    stats.add_argument("--json", action="store_true")
+    stats.add_argument(
+        "--from", dest="start", type=date_argument, help="stats of a range, default January 1st"
+    )
+    stats.add_argument("--to", dest="stop", type=date_argument, help="last day, default today")
+    stats.set_defaults(function=stats_command)
+
+    level = subparsers.add_parser("level", help="level and xp of a skill")
+    level.add_argument("skill")
+    level.add_argument("--json", action="store_true")
+    level.set_defaults(function=level_command)
+
+    export = subparsers.add_parser("export", help="write the entries or skills to a file")
+    export.add_argument("--table", choices=["entries", "skills"], default="entries")
+    export.add_argument(
+        "--format", choices=["json", "ndjson", "csv"], help="default from the extension or json"
+    )
+    export.add_argument("--skill", help="only the entries of this skill")
+    export.add_argument("--from", dest="start", type=date_argument, help="first day")
+    export.add_argument("--to", dest="stop", type=date_argument, help="last day")
+    export.add_argument("--output", "-o", help="file to write, default stdout")
+    export.add_argument(
+        "--gzip", action="store_true", help="compress the output, default for .gz files"
+    )
+    export.set_defaults(function=export_command)
+
+    import_parser = subparsers.add_parser(
+        "import", help="import entries or skills from a json, ndjson or csv file"
+    )
+    import_parser.add_argument("file", help="file with skill, date and minutes, - for stdin")
+    import_parser.add_argument("--table", choices=["entries", "skills"], default="entries")
+    import_parser.add_argument(
+        "--format", choices=["json", "ndjson", "csv"], help="default from the extension"
+    )
+    import_parser.add_argument(
+        "--mode",
+        choices=["add", "replace"],
+        default="add",
+        help="add the minutes to existing days or replace them (default add)",
+    )
+    import_parser.add_argument("--batch-size", type=int, default=10000)
+    import_parser.add_argument("--quiet", action="store_true", help="no progress counter")
+    import_parser.set_defaults(function=import_command)
+
+    compact = subparsers.add_parser(
+        "compact", help="remove the days without minutes from the database"
+    )
+    compact.set_defaults(function=compact_command)
+
+    rebuild = subparsers.add_parser(
+        "rebuild-totals", help="recompute total minutes and levels of every skill"
+    )
+    rebuild.add_argument(
+        "--check", action="store_true", help="only report skills with wrong totals"
+    )
+    rebuild.set_defaults(function=rebuild_totals_command)
+
+    rollups = subparsers.add_parser(
+        "rebuild-rollups", help="recompute the weekly and monthly totals of every skill"
+    )
+    rollups.set_defaults(function=rebuild_rollups_command)
+
+    streak_parser = subparsers.add_parser(
+        "rebuild-streaks", help="recompute the streaks and averages of every skill"
+    )
+    streak_parser.add_argument(
+        "--check", action="store_true", help="only report skills with wrong streaks"
+    )
+    streak_parser.set_defaults(function=rebuild_streaks_command)
+
+    render = subparsers.add_parser(
+        "render", help="write graphs to png or svg files, works without a display"
+    )
+    render.add_argument(
+        "skills", nargs="*", help="skills in one graph, default every skill in its own graphs"
+    )
+    render.add_argument(
+        "--range",
+        choices=["all", "month", "week"],
+        action="append",
+        help="graph of all time, the past month or week, can be repeated (default all three)",
+    )
+    render.add_argument("--format", choices=["png", "svg"], default="png")
+    render.add_argument("--style", choices=["xkcd", "plain"], default="xkcd")
+    render.add_argument("--output-dir", help="default the graph_dir setting")
+    render.add_argument("--workers", type=int, help="processes drawing the graphs")
+    render.set_defaults(function=render_command)
+
+    serve = subparsers.add_parser("serve", help="run a HTTP/JSON api, see server.py")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8000)
+    serve.add_argument("--readers", type=int, default=4, help="threads answering reads")
+    serve.set_defaults(function=serve_command)
+
+    backup = subparsers.add_parser("backup", help="create, list, verify or restore backups")
+    actions = backup.add_subparsers(dest="action", required=True)
+    directory = argparse.ArgumentParser(add_help=False)
+    directory.add_argument("--directory", help="default the backup_dir setting")
+    create = actions.add_parser(
+        "create",
+        parents=[directory],
+        help="back up the database, then remove the backups that are not kept",
+    )
+    create.add_argument("--no-compress", action="store_true", help="don't gzip the backup")
+    actions.add_parser("list", parents=[directory], help="list the backups, newest first")
+    actions.add_parser(
+        "prune", parents=[directory], help="remove the backups that are not kept"
+    )
+    verify = actions.add_parser("verify", help="check that a backup can be restored")
+    verify.add_argument("file")
+    restore = actions.add_parser(
+        "restore", help="replace the database with a backup, the current one is backed up first"
+    )
+    restore.add_argument("file")
+    backup.set_defaults(function=backup_command)
+    return parser.parse_args()
+
+
+def run(args):
+    """Run the command given on the command line"""
+    if args.profile_startup:
+        profile_startup()
+        return
+    start_tracing(args)
+    prepare_database()
+    if args.command == "serve":
+        args.function(args)  # runs until it is stopped, that is no action to time
+        return
+    from instrument import action
+
+    with action(args.command):
+        args.function(args)
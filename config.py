@@ -0,0 +1,69 @@
+# Settings of LevelUp, read from the config file and the environment
+# Environment variables (LVLUP_<SETTING>) take precedence over the [lvlup] section of the file
+
+import configparser
+import os
+
+# directory of the program, also when it is started from another directory or imported
+BASE = os.path.dirname(os.path.abspath(__file__))
+# the config file lives next to main.py, unless LVLUP_CONFIG points somewhere else
+CONFIG_FILE = os.environ.get("LVLUP_CONFIG", BASE + os.sep + "lvlup.ini")
+
+DEFAULTS = {
+    # any sqlite url (other databases are not supported), sqlite:// keeps the database in memory
+    "database_url": "sqlite:///" + BASE + os.sep + "db/level.db",
+    # pragmas applied to every new sqlite connection, see models.PRAGMA_PROFILES
+    "profile": "performance",
+    # only store days with minutes in them
+    "sparse_entries": "yes",
+    # level curve by name and its arguments separated by commas, see levels.py
+    "level_curve": "square",
+    "level_curve_args": "",
+    # backups go to this directory, default a backups directory next to the database
+    "backup_dir": "",
+    # gzip the backups
+    "backup_compress": "yes",
+    # newest backup of the last 7 days and the last 4 weeks are kept, see backup.py
+    "backup_keep_daily": "7",
+    "backup_keep_weekly": "4",
+    # rendered graphs are written to and cached in this directory, see render.py
+    "graph_dir": BASE + os.sep + "graphs",
+    # most points drawn for a line of a graph, longer histories are downsampled
+    "graph_points": "500",
+    # most series, stats and levels kept in memory, see cache.py
+    "cache_size": "128",
+    # open connections kept for a sqlite file, one per thread of the server
+    "pool_size": "5",
+    # milliseconds to wait for another connection that is writing, then retries with backoff
+    "busy_timeout": "5000",
+    "busy_retries": "5",
+    # count sql statements and time every action, like --trace, see instrument.py
+    "trace": "no",
+    # actions slower than this many milliseconds are written to the slow log
+    "slow_ms": "500",
+    "slow_log": BASE + os.sep + "slow.log",
+}
+
+
+def load_config(path=CONFIG_FILE):
+    """Return a dictionary with all settings, from the defaults, the file and the environment"""
+    settings = dict(DEFAULTS)
+    parser = configparser.ConfigParser()
+    parser.read(path)  # a missing file is fine, the defaults are used
+    if parser.has_section("lvlup"):
+        settings.update(parser["lvlup"])
+    for name in DEFAULTS:
+        value = os.environ.get("LVLUP_" + name.upper())
+        if value is not None:
+            settings[name] = value
+    return settings
+
+
+def as_boolean(value):
+    """Turn a setting like yes/no, true/false or 1/0 into a boolean"""
+    return str(value).strip().lower() in ("1", "yes", "true", "on")
+
+
+def as_numbers(value):
+    """Turn a setting with numbers separated by commas into a list of floats"""
+    return [float(number) for number in str(value).split(",") if number.strip()]
@@ -0,0 +1,116 @@
+# Export entries and skills as csv, ndjson or json files that the importer reads back
+# Rows are fetched from the database in chunks and written as they come, memory stays the same for any table size
+
+import csv
+import gzip
+import io
+import json
+import sys
+
+from models import Entry, Skill, session
+
+# rows fetched from the database at a time
+FETCH_SIZE = 1000
+# bytes collected before they are written to the file
+BUFFER_SIZE = 1 << 16
+
+# columns of every table that can be exported, in the order they are written
+FIELDS = {
+    "entries": ("skill", "date", "minutes"),
+    "skills": ("name", "daily_goal", "total_minutes", "current_level", "xp_points"),
+}
+
+
+def query_rows(table, skillname=None, start=None, stop=None):
+    """Yield the rows of a table as tuples, entries can be limited to a skill and a date range"""
+    if table == "entries":
+        query = session.query(Entry.skill, Entry.date, Entry.minutes).order_by(
+            Entry.skill, Entry.date
+        )
+        if skillname:
+            query = query.filter(Entry.skill == skillname)
+        if start:
+            query = query.filter(Entry.date >= start)
+        if stop:
+            query = query.filter(Entry.date <= stop)
+    elif table == "skills":
+        query = session.query(*(getattr(Skill, field) for field in FIELDS["skills"]))
+        query = query.order_by(Skill.name)
+        if skillname:
+            query = query.filter(Skill.name == skillname)
+    else:
+        raise ValueError(f"Unknown table {table}, choose one of {', '.join(FIELDS)}")
+    return query.yield_per(FETCH_SIZE)
+
+
+def write_csv(file, fields, rows):
+    """Write the rows as csv with a header line"""
+    writer = csv.writer(file)
+    writer.writerow(fields)
+    writer.writerows(rows)
+
+
+def write_ndjson(file, fields, rows):
+    """Write one json object per row and line"""
+    for row in rows:
+        file.write(json.dumps(dict(zip(fields, row)), default=str) + "\n")
+
+
+def write_json(file, fields, rows):
+    """Write the rows as a json array, one object per line"""
+    separator = "[\n"
+    for row in rows:
+        file.write(separator + json.dumps(dict(zip(fields, row)), default=str))
+        separator = ",\n"
+    file.write("[]\n" if separator == "[\n" else "\n]\n")
+
+
+WRITERS = {"json": write_json, "ndjson": write_ndjson, "csv": write_csv}
+
+
+def open_output(path=None, compress=None):
+    """Open a binary file for writing (stdout without a path), return it and the stream to write to,
+    which is gzip compressed if compress is set or the path ends with .gz"""
+    if compress is None:
+        compress = bool(path) and path.endswith(".gz")
+    raw = open(path, "wb") if path and path != "-" else sys.stdout.buffer
+    return raw, gzip.GzipFile(fileobj=raw, mode="wb") if compress else raw
+
+
+def export_table(
+    table="entries",
+    path=None,
+    file_format=None,
+    skillname=None,
+    start=None,
+    stop=None,
+    compress=None,
+):
+    """Write all rows of a table to a file (stdout without a path), return the number of rows"""
+    from importer import detect_format
+
+    file_format = file_format or (detect_format(path) if path and path != "-" else "json")
+    count = 0
+
+    def counted(rows):
+        nonlocal count
+        for row in rows:
+            count += 1
+            yield row
+
+    raw, binary = open_output(path, compress)
+    text = io.TextIOWrapper(
+        io.BufferedWriter(binary, BUFFER_SIZE), encoding="utf-8", newline=""
+    )
+    try:
+        rows = counted(query_rows(table, skillname, start, stop))
+        WRITERS[file_format](text, FIELDS[table], rows)
+    finally:
+        text.detach().detach()  # flushes the buffers, stdout stays open
+        if binary is not raw:
+            binary.close()  # writes the end of the gzip stream
+        if raw is sys.stdout.buffer:
+            raw.flush()
+        else:
+            raw.close()
+    return count
@@ -1,41 +1,101 @@
 # call matplotlib with the data of the learning progress
-# all graphs are show in XKCD style
+# all graphs are show in XKCD style, or written to a file, see render.py
+
+import contextlib
+import datetime
 
 import matplotlib.pyplot as plt
+import numpy as np
 from matplotlib import dates as mpl_dates
 
+from instrument import waiting
+from models import SETTINGS
+
+# most points drawn for a line, longer lines are downsampled, so drawing takes the same time for any history
+POINT_BUDGET = int(SETTINGS["graph_points"])
+
 
 def add_hours(minutes_list):
     """Take a list of minutes and convert it into cumulative list of hours"""
-    hours_progress = []  # instantiate an empty list
-    total = 0  # total starts at 0
-    for minutes in minutes_list:
-        total += minutes / 60  # convert minutes to hours and add to total
-        hours_progress.append(total)  # add new total to the list
-    return hours_progress  # return list of totals
+    return np.cumsum(minutes_list, dtype=np.float64) / 60
+
+
+def downsample(dates, values, budget=POINT_BUDGET):
+    """Return the indices of at most budget points that keep the shape of the line,
+    with the largest triangle three buckets algorithm. First and last point are always kept"""
+    count = len(dates)
+    if count <= budget or budget < 3:
+        return np.arange(count)
+    x = dates.astype("datetime64[D]").astype(np.float64)
+    y = np.asarray(values, dtype=np.float64)
+    # the points between first and last are split into budget - 2 buckets
+    edges = np.linspace(1, count - 1, budget - 1).astype(np.int64)
+    edges = np.append(edges, count)  # the last point is the bucket after the last one
+    indices = np.empty(budget, dtype=np.int64)
+    indices[0], indices[-1] = 0, count - 1
+    chosen = 0
+    for bucket in range(budget - 2):
+        first, stop = edges[bucket], edges[bucket + 1]
+        # the point of the bucket with the biggest triangle between the point chosen before
+        # and the average of the next bucket is kept
+        next_x = x[stop : edges[bucket + 2]].mean()
+        next_y = y[stop : edges[bucket + 2]].mean()
+        areas = np.abs(
+            (x[chosen] - next_x) * (y[first:stop] - y[chosen])
+            - (x[chosen] - x[first:stop]) * (next_y - y[chosen])
+        )
+        chosen = first + int(areas.argmax())
+        indices[bucket + 1] = chosen
+    return indices
+
 
+def graph_style(style):
+    """Return a context with the style of the graphs, xkcd or plain matplotlib"""
+    return plt.xkcd() if style == "xkcd" else contextlib.nullcontext()
 
-def plot_cumulated_progress(skills, start):
+
+def finish(fig, output):
+    """Show the figure in a window, or write it to the output file (png or svg) and return its path"""
+    if output is None:
+        with waiting():  # the window stays open as long as the user looks at it
+            plt.show()
+    else:
+        fig.savefig(output)
+        plt.close(fig)  # figures are kept until they are closed
+    return output
+
+
+def plot_cumulated_progress(skills, start, output=None, style="xkcd"):
     """Plot the cumulated progress in the given skills"""
+    with graph_style(style):
+        return draw_cumulated_progress(skills, start, output)
+
+
+def draw_cumulated_progress(skills, start, output):
+    """Draw the cumulated progress in the current style"""
     # basic plot setup
-    plt.xkcd()
     fig = plt.figure()
     ax = fig.add_subplot(111)
 
     # go through every key (skill) in the dict and plot it's stats
-    for key, value in skills.items():
-        # plot the goal line
-        goal_list = [value["goal"] for i in range(len(value["dates"]))]
-        accumulated_goal = add_hours(goal_list)  #
+    for key, series in skills.items():
+        series = series[start:]  # a view, the minutes are not copied
+        dates = series.dates
+        # plot the goal line, every point can stand for a day, a week or a month
+        tomorrow = np.datetime64(datetime.date.today(), "D") + 1
+        days = np.diff(dates, append=tomorrow).astype(int)
+        accumulated_goal = add_hours(series.goal * days)
+        # the cumulated progress line with hours added up
+        hours_progress = add_hours(series.minutes)
+        # long histories are drawn with fewer points, chosen by the progress line
+        keep = downsample(dates, hours_progress)
         ax.plot(
-            value["dates"],
-            accumulated_goal,
+            dates[keep],
+            accumulated_goal[keep],
             linestyle="dotted",
             label=f"Goal line for {key}",
         )
-        # plot the cumulated progress line with hours added up
-        hours_progress = add_hours(value["minutes"][start:])
-        ax.plot(value["dates"], hours_progress, linestyle="solid", label=key)
+        ax.plot(dates[keep], hours_progress[keep], linestyle="solid", label=key)
         ax.set_ylim(bottom=0)  # let the y axis start at 0
         # customise plot title if one or more skills were selected
         if len(skills) < 2:
@@ -51,34 +111,40 @@ def plot_cumulated_progress(skills, start):
     plt.grid(True)
     plt.tight_layout()
     # show the graph
-    plt.show()
+    return finish(fig, output)
 
 
-def plot_minutes(skills, start):
+def plot_minutes(skills, start, output=None, style="xkcd"):
     """Plot minutes per day in time range"""
+    with graph_style(style):
+        return draw_minutes(skills, start, output)
+
+
+def draw_minutes(skills, start, output):
+    """Draw the minutes per day in the current style"""
     # basic plot setup
-    plt.xkcd()
     fig = plt.figure()
     ax = fig.add_subplot(111)
 
     # loop through skills and plot their lines
-    for key, value in skills.items():
-        latest_date_strings = value["dates"][start:]
-        daily_goal = value["goal"]
-        # if it exists, plot the daily_goal line
-        if daily_goal > 0:
-            daily_goal_list = [daily_goal for i in range(len(latest_date_strings))]
+    for key, series in skills.items():
+        latest = series[start:]  # a view, the minutes are not copied
+        latest_dates = latest.dates
+        daily_goal = latest.goal
+        # if it exists, plot the daily_goal line, a straight line only needs its ends
+        if daily_goal > 0 and len(latest_dates):
             ax.plot(
-                latest_date_strings,
-                daily_goal_list,
+                latest_dates[[0, -1]],
+                np.full(2, daily_goal),
                 linestyle="dotted",
                 label=f"Daily Goal for {key}",
             )
         # plot the invested minutes line
-        latest_hours = value["minutes"][start:]
-        ax.plot(latest_date_strings, latest_hours, linestyle="solid", label=key)
+        latest_minutes = latest.minutes
+        keep = downsample(latest_dates, latest_minutes)
+        ax.plot(latest_dates[keep], latest_minutes[keep], linestyle="solid", label=key)
         # basic y axis setup
-        ax.set_ylim(bottom=0, top=(max(latest_hours) + 110))
+        ax.set_ylim(bottom=0, top=(int(latest_minutes.max(initial=0)) + 110))
         # customize the plot title
         if len(skills) < 2:
             plt.title(f"Minues per day for {key}")
@@ -93,4 +159,4 @@ def plot_minutes(skills, start):
     plt.grid(True)
     plt.tight_layout()
     # show the graph
-    plt.show()
+    return finish(fig, output)
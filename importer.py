@@ -0,0 +1,210 @@
+# Import entries from other trackers: json arrays, ndjson and csv files
+# Files are read as a stream and written in batches, memory stays the same for any file size
+
+import csv
+import datetime
+import gzip
+import json
+import re
+import sys
+
+import models
+
+# json is read in chunks of this many characters
+CHUNK_SIZE = 1 << 16
+# whitespace and commas between the objects of a json array
+SEPARATOR = re.compile(r"[\s,]*")
+
+# how the minutes of a row are written when the skill already has an entry on that day
+UPSERTS = {
+    # add the minutes to the entry, like logging them
+    "add": "minutes = minutes + excluded.minutes",
+    # overwrite the entry, importing the same file twice changes nothing
+    "replace": "minutes = excluded.minutes",
+}
+
+
+def read_json_array(file):
+    """Yield the objects of a json array one by one, without reading the whole file"""
+    decoder = json.JSONDecoder()
+    buffer = file.read(CHUNK_SIZE).lstrip()
+    if not buffer.startswith("["):
+        raise ValueError("A json file has to contain an array of entries.")
+    position = 1
+    while True:
+        position = SEPARATOR.match(buffer, position).end()
+        if buffer.startswith("]", position):
+            return
+        try:
+            row, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # the object goes on in the next chunk, keep only what is left
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                raise
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield row
+
+
+def read_ndjson(file):
+    """Yield one object for every line of a ndjson file"""
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_csv(file):
+    """Yield one dictionary for every row of a csv file with a header line"""
+    yield from csv.DictReader(file)
+
+
+READERS = {"json": read_json_array, "ndjson": read_ndjson, "csv": read_csv}
+EXTENSIONS = {".json": "json", ".ndjson": "ndjson", ".jsonl": "ndjson", ".csv": "csv"}
+
+
+def detect_format(path):
+    """Return the format of a file from its extension, compressed files end with .gz"""
+    path = path.lower()
+    if path.endswith(".gz"):
+        path = path[:-3]
+    for extension, file_format in EXTENSIONS.items():
+        if path.endswith(extension):
+            return file_format
+    raise ValueError(f"Unknown format of {path}, choose one of {', '.join(READERS)}")
+
+
+def read_rows(path, file_format=None):
+    """Yield the row number and the row of every row in a file (- for stdin), gzip files are decompressed"""
+    file_format = file_format or detect_format(path)
+    if path == "-":
+        file = sys.stdin
+    elif path.endswith(".gz"):
+        file = gzip.open(path, "rt", newline="", encoding="utf-8")
+    else:
+        file = open(path, newline="", encoding="utf-8")
+    with file:
+        yield from enumerate(READERS[file_format](file), start=1)
+
+
+def validate_row(row):
+    """Return skill, date (YYYY-MM-DD) and minutes of a row, raise ValueError if it is invalid"""
+    try:
+        skillname, date, minutes = row["skill"], row["date"], row["minutes"]
+    except (KeyError, TypeError):
+        raise ValueError("needs skill, date and minutes")
+    if None in (skillname, date, minutes):  # short csv lines
+        raise ValueError("needs skill, date and minutes")
+    date = datetime.date.fromisoformat(str(date)[:10]).isoformat()
+    return validate_name(skillname), date, validate_minutes(minutes)
+
+
+def validate_skill_row(row):
+    """Return name and daily goal of a row of the skills table, raise ValueError if it is invalid"""
+    try:
+        skillname, goal = row["name"], row.get("daily_goal") or 0
+    except (KeyError, TypeError, AttributeError):
+        raise ValueError("needs a name")
+    return validate_name(skillname), validate_minutes(goal)
+
+
+def validate_name(skillname):
+    """Return a skill name the way create_skill stores it"""
+    skillname = str(skillname).strip().lower().title()
+    if not skillname or " " in skillname:
+        raise ValueError(f"invalid skill name {skillname!r}")
+    return skillname
+
+
+def validate_minutes(minutes):
+    """Return minutes as an integer of 0 or more"""
+    minutes = int(minutes)
+    if minutes < 0:
+        raise ValueError("minutes can't be negative")
+    return minutes
+
+
+INSERT_SKILL = (
+    "INSERT OR IGNORE INTO skills (name, current_level, total_minutes, xp_points, daily_goal) "
+    "VALUES (?, 0, 0, 0, 0)"
+)
+# the goal is the only setting of a skill, level and totals come from the entries
+UPSERT_SKILL = (
+    "INSERT INTO skills (name, current_level, total_minutes, xp_points, daily_goal) "
+    "VALUES (?, 0, 0, 0, ?) ON CONFLICT (name) DO UPDATE SET daily_goal = excluded.daily_goal"
+)
+
+
+def write_batch(connection, batch, mode):
+    """Write a batch of (skill, date, minutes) rows with a single executemany"""
+    connection.execute(
+        "INSERT INTO entries (skill, date, minutes) VALUES (?, ?, ?) "
+        f"ON CONFLICT (skill, date) DO UPDATE SET {UPSERTS[mode]}",
+        batch,
+    )
+
+
+def import_entries(path, file_format=None, batch_size=10000, mode="add", progress=True):
+    """
+    Import all entries of a file (- for stdin) into the database, skills that don't exist yet are created.
+    Totals, levels and rollups are rebuilt once at the end.
+    Return the number of imported rows and a list of (row number, error) for the skipped rows"""
+    if mode not in UPSERTS:
+        raise ValueError(f"Unknown mode {mode}, choose one of {', '.join(UPSERTS)}")
+    connection = models.session.connection()  # everything is one transaction
+    skills = set(models.get_skill_names())
+    imported = 0
+    skipped = []
+    batch = []
+    for number, row in read_rows(path, file_format):
+        try:
+            skillname, date, minutes = validate_row(row)
+        except ValueError as error:
+            skipped.append((number, str(error)))
+            continue
+        if skillname not in skills:
+            connection.execute(INSERT_SKILL, (skillname,))
+            skills.add(skillname)
+        batch.append((skillname, date, minutes))
+        if len(batch) >= batch_size:
+            write_batch(connection, batch, mode)
+            imported += len(batch)
+            batch = []
+            if progress:
+                print(f"\rImported {imported} entries", end="", file=sys.stderr)
+    if batch:
+        write_batch(connection, batch, mode)
+        imported += len(batch)
+    if progress:
+        print(f"\rImported {imported} entries", file=sys.stderr)
+    # with sparse entries, days that were imported without minutes are not kept
+    if models.SPARSE_ENTRIES:
+        connection.execute("DELETE FROM entries WHERE minutes = 0")
+    models.session.commit()
+    # derived data is only computed once, not after every row, this also clears the cache
+    models.rebuild_totals()
+    models.rebuild_rollups()
+    models.rebuild_streaks()
+    return imported, skipped
+
+
+def import_skills(path, file_format=None):
+    """
+    Import the skills and their daily goals of a file written by the exporter, existing skills get the new goal.
+    Return the number of imported rows and a list of (row number, error) for the skipped rows"""
+    connection = models.session.connection()
+    imported = 0
+    skipped = []
+    for number, row in read_rows(path, file_format):
+        try:
+            skillname, goal = validate_skill_row(row)
+        except ValueError as error:
+            skipped.append((number, str(error)))
+            continue
+        connection.execute(UPSERT_SKILL, (skillname, goal))
+        imported += 1
+    models.session.commit()
+    models.rebuild_totals()
+    models.rebuild_streaks()  # the goal streaks are counted with the new goals
+    return imported, skipped
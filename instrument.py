@@ -0,0 +1,200 @@
+# Opt-in instrumentation: sql statements, commits and time of every user action
+# Switched on with --trace or LVLUP_TRACE=yes, a summary is printed after every action
+# and actions slower than slow_ms are appended to a rotating log file
+
+import contextlib
+import logging
+import logging.handlers
+import sys
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from cache import check
+from config import as_boolean
+from models import SETTINGS
+
+ENABLED = as_boolean(SETTINGS["trace"])
+REPORT = ENABLED  # print a summary after every action
+# actions that take longer are written to the slow log
+SLOW_MS = float(SETTINGS["slow_ms"])
+SLOW_LOG = SETTINGS["slow_log"]
+# the slow log is rotated at this size, the last few files are kept
+SLOW_LOG_BYTES = 1 << 20
+SLOW_LOG_FILES = 3
+# numbers of an action that are added up over all its runs
+FIELDS = ("ms", "statements", "sql_ms", "commits", "commit_ms")
+
+TOTALS = {}  # action name -> runs and FIELDS added up
+LAST = {}  # the numbers of the last action that finished
+LOCK = threading.Lock()
+LOCAL = threading.local()  # the action running in this thread, statements of other threads don't count
+INSTALLED = False
+
+
+def current():
+    """Return the numbers of the action running in this thread, None outside of an action"""
+    return getattr(LOCAL, "action", None)
+
+
+def before_execute(conn, cursor, statement, parameters, context, executemany):
+    """Remember when a statement started"""
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def after_execute(conn, cursor, statement, parameters, context, executemany):
+    """Count a statement and its time for the running action"""
+    starts = conn.info.get("query_start")
+    if not starts:
+        return  # started before the listeners were installed
+    elapsed = (time.perf_counter() - starts.pop()) * 1000
+    numbers = current()
+    if numbers is None:
+        return
+    numbers["statements"] += 1
+    numbers["sql_ms"] += elapsed
+    if elapsed > numbers["slowest_ms"]:
+        numbers["slowest_ms"] = elapsed
+        numbers["slowest"] = " ".join(statement.split())  # one line for the log
+
+
+def before_commit(conn):
+    """Count a commit of the running action"""
+    numbers = current()
+    if numbers is not None:
+        numbers["commits"] += 1
+        LOCAL.commit_start = time.perf_counter()
+
+
+def after_commit(session):
+    """Add the time of a commit to the running action"""
+    # the commit event of the engine comes right before, commits without a session aren't timed
+    start = getattr(LOCAL, "commit_start", None)
+    numbers = current()
+    if start is not None and numbers is not None:
+        numbers["commit_ms"] += (time.perf_counter() - start) * 1000
+    LOCAL.commit_start = None
+
+
+def install():
+    """Listen to the events of every engine and session, also the ones created later"""
+    global INSTALLED
+    if INSTALLED:
+        return
+    event.listen(Engine, "before_cursor_execute", before_execute)
+    event.listen(Engine, "after_cursor_execute", after_execute)
+    event.listen(Engine, "commit", before_commit)
+    event.listen(Session, "after_commit", after_commit)
+    INSTALLED = True
+
+
+def enable(report=True):
+    """Switch the instrumentation on, without report the numbers are only kept for counters()"""
+    global ENABLED, REPORT
+    ENABLED, REPORT = True, report
+    install()
+
+
+def slow_logger():
+    """Return the logger of the slow log, the file is opened the first time"""
+    logger = logging.getLogger("lvlup.slow")
+    if not logger.handlers:
+        handler = logging.handlers.RotatingFileHandler(
+            SLOW_LOG, maxBytes=SLOW_LOG_BYTES, backupCount=SLOW_LOG_FILES
+        )
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False  # only into the file, not on the screen
+    return logger
+
+
+def describe(name, numbers):
+    """Return one line with the numbers of an action"""
+    return (
+        f"{name}: {numbers['ms']:.1f} ms, {numbers['statements']} sql statements "
+        f"in {numbers['sql_ms']:.1f} ms, {numbers['commits']} commits in {numbers['commit_ms']:.1f} ms"
+    )
+
+
+@contextlib.contextmanager
+def action(name):
+    """Count and time everything in the block as one user action, like logging minutes or a graph.
+    Only counts when the instrumentation is on, an action inside another one counts for the outer one.
+    Every action first looks for writes of other processes, once for all the cached data it uses"""
+    if getattr(LOCAL, "running", False):
+        yield
+        return
+    LOCAL.running = True
+    try:
+        if not ENABLED:
+            check()
+            yield
+            return
+        numbers = dict.fromkeys(FIELDS, 0)
+        numbers.update(waited_ms=0, slowest_ms=0, slowest="")
+        LOCAL.action = numbers
+        start = time.perf_counter()
+        try:
+            check()  # counted with the action
+            yield
+        finally:
+            LOCAL.action = None
+            # the time waiting for the user is not part of the action
+            numbers["ms"] = (time.perf_counter() - start) * 1000 - numbers["waited_ms"]
+            finish(name, numbers)
+    finally:
+        LOCAL.running = False
+
+
+def finish(name, numbers):
+    """Add the numbers of a finished action to the totals, report and log it if it was slow"""
+    with LOCK:
+        totals = TOTALS.setdefault(name, dict(dict.fromkeys(FIELDS, 0), runs=0))
+        totals["runs"] += 1
+        for field in FIELDS:
+            totals[field] += numbers[field]
+        LAST.clear()
+        LAST.update(numbers, action=name)
+    if REPORT:
+        print(f"[trace] {describe(name, numbers)}", file=sys.stderr)
+    if numbers["ms"] > SLOW_MS:
+        message = describe(name, numbers)
+        if numbers["slowest"]:
+            message += f", slowest {numbers['slowest_ms']:.1f} ms: {numbers['slowest'][:500]}"
+        slow_logger().info(message)
+
+
+@contextlib.contextmanager
+def waiting():
+    """Leave the time in the block out of the running action, e.g. a graph window that is open"""
+    numbers = current()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if numbers is not None:
+            numbers["waited_ms"] += (time.perf_counter() - start) * 1000
+
+
+def counters():
+    """Return the numbers of every action added up and the numbers of the last action, as a dict"""
+    with LOCK:
+        return {
+            "actions": {name: dict(totals) for name, totals in TOTALS.items()},
+            "last": dict(LAST),
+        }
+
+
+def reset():
+    """Forget the numbers of all actions"""
+    with LOCK:
+        TOTALS.clear()
+        LAST.clear()
+
+
+if ENABLED:
+    install()  # switched on in the settings or with LVLUP_TRACE
@@ -0,0 +1,151 @@
+# Level curves, they decide how many hours it takes to reach the next level
+# Every curve works on integer minutes, so there is no drift from adding up floats
+# numpy is only imported by the vectorized methods, a single level does not need it
+
+import bisect
+
+
+class LevelCurve:
+    """
+    Level curve with a number of hours for every level.
+    Reaching level n takes hours_for(n) hours on top of the hours for level n - 1.
+    The cumulative thresholds in minutes are precomputed and searched with bisect"""
+
+    def __init__(self, hours_for):
+        self.hours_for = hours_for  # function: level -> hours needed for that level
+        self.thresholds = [0]  # minutes needed in total to reach level 0, 1, 2, ...
+
+    def _extend(self, total_minutes):
+        """Precompute the thresholds until the last one is above total_minutes"""
+        while self.thresholds[-1] <= total_minutes:
+            level = len(self.thresholds)
+            step = max(round(self.hours_for(level) * 60), 1)  # at least a minute
+            self.thresholds.append(self.thresholds[-1] + step)
+
+    def threshold(self, level):
+        """Return the total number of minutes needed to reach the level"""
+        while len(self.thresholds) <= level:
+            self._extend(self.thresholds[-1])
+        return self.thresholds[level]
+
+    def level(self, total_minutes):
+        """Return the level reached with the total number of minutes"""
+        self._extend(total_minutes)
+        return bisect.bisect_right(self.thresholds, total_minutes) - 1
+
+    def levels(self, totals):
+        """Vectorized form of level, return an array of levels for an array of minutes"""
+        import numpy as np
+
+        totals = np.asarray(totals, dtype=np.int64)
+        if len(totals):
+            self._extend(int(totals.max()))
+        return np.searchsorted(self.thresholds, totals, side="right") - 1
+
+    def calculate(self, total_minutes):
+        """Return current level, next level, xp points and xp required (in hours)"""
+        current_level = self.level(total_minutes)
+        next_level = current_level + 1
+        xp_points = round((total_minutes - self.threshold(current_level)) / 60, 2)
+        level_hours = (self.threshold(next_level) - self.threshold(current_level)) / 60
+        xp_required = round(level_hours - xp_points, 1)
+        return current_level, next_level, xp_points, xp_required
+
+    def thresholds_for(self, levels):
+        """Vectorized form of threshold, return an array of minutes for an array of levels"""
+        import numpy as np
+
+        levels = np.asarray(levels, dtype=np.int64)
+        if len(levels):
+            self.threshold(int(levels.max()))
+        return np.asarray(self.thresholds, dtype=np.int64)[levels]
+
+    def calculate_all(self, totals):
+        """Vectorized form of calculate, return arrays for an array of total minutes"""
+        import numpy as np
+
+        totals = np.asarray(totals, dtype=np.int64)
+        current_levels = self.levels(totals)
+        next_levels = current_levels + 1
+        current_thresholds = self.thresholds_for(current_levels)
+        xp_points = np.round((totals - current_thresholds) / 60, 2)
+        level_hours = (self.thresholds_for(next_levels) - current_thresholds) / 60
+        # numpy rounds halves differently, use round to match calculate exactly
+        xp_required = np.array(
+            [round(hours, 1) for hours in (level_hours - xp_points).tolist()]
+        )
+        return current_levels, next_levels, xp_points, xp_required
+
+
+class SquareCurve(LevelCurve):
+    """
+    The original LevelUp curve: level n takes n ** 2 hours.
+    Reaching level n takes n(n+1)(2n+1)/6 hours in total, this is inverted directly"""
+
+    def __init__(self):
+        super().__init__(lambda level: level ** 2)
+
+    @staticmethod
+    def cumulative(level):
+        """Return the total number of minutes needed to reach the level"""
+        return 10 * level * (level + 1) * (2 * level + 1)  # n(n+1)(2n+1)/6 * 60
+
+    def threshold(self, level):
+        return self.cumulative(level)
+
+    def level(self, total_minutes):
+        # cumulative(n) is close to 20 * (n + 0.5) ** 3, start there and correct
+        level = max(int((total_minutes / 20) ** (1 / 3) - 0.5), 0)
+        while self.cumulative(level + 1) <= total_minutes:
+            level += 1
+        while level > 0 and self.cumulative(level) > total_minutes:
+            level -= 1
+        return level
+
+    def levels(self, totals):
+        import numpy as np
+
+        totals = np.asarray(totals, dtype=np.int64)
+        levels = np.maximum(np.cbrt(totals / 20) - 0.5, 0).astype(np.int64)
+        # the estimate is off by at most one level in either direction
+        for _ in range(2):
+            levels += self.cumulative(levels + 1) <= totals
+            levels -= (levels > 0) & (self.cumulative(levels) > totals)
+        return levels
+
+    def thresholds_for(self, levels):
+        import numpy as np
+
+        return self.cumulative(np.asarray(levels, dtype=np.int64))
+
+
+def linear_curve(hours=1):
+    """Level n takes n * hours hours"""
+    return LevelCurve(lambda level: level * hours)
+
+
+def exponential_curve(hours=1, factor=1.5):
+    """Level 1 takes hours hours, every level after that takes factor times as long"""
+    return LevelCurve(lambda level: hours * factor ** (level - 1))
+
+
+def table_curve(table):
+    """Level n takes table[n - 1] hours, after the table the last step is repeated"""
+    table = list(table)
+    return LevelCurve(lambda level: table[min(level, len(table)) - 1])
+
+
+# all curves that can be chosen by name
+CURVES = {
+    "square": SquareCurve,
+    "linear": linear_curve,
+    "exponential": exponential_curve,
+    "table": table_curve,
+}
+
+
+def make_curve(name, *args, **kwargs):
+    """Return a new level curve by name, args are passed on to the curve"""
+    if name not in CURVES:
+        raise ValueError(f"Unknown level curve {name}, choose from {', '.join(CURVES)}")
+    return CURVES[name](*args, **kwargs)
@@ -0,0 +1,115 @@
+# Load test for the api of server.py, run the server on a scratch database first:
+#   LVLUP_DATABASE_URL=sqlite:////tmp/lvlup.db python main.py serve
+#   python loadtest.py --skill Python
+# Every client keeps its connection open and sends requests one after another,
+# a part of them are logs of 1 minute, the rest reads of levels, series and stats
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+import urllib.parse
+
+
+async def request(reader, writer, method, path, body=b""):
+    """Send a request over an open connection, return the status and the json of the answer"""
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: lvlup\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+        + body
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode().partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def client(host, port, skillname, requests, write_ratio, results):
+    """Send requests and add (kind, status, seconds) of each to the results"""
+    quoted = urllib.parse.quote(skillname)
+    reads = [
+        f"/skills/{quoted}",
+        f"/skills/{quoted}/series?period=week",
+        f"/stats?skill={quoted}",
+    ]
+    log = json.dumps({"minutes": 1}).encode()
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(requests):
+            start = time.perf_counter()
+            if random.random() < write_ratio:
+                kind = "write"
+                status, _ = await request(reader, writer, "POST", f"/skills/{quoted}/log", log)
+            else:
+                kind = "read"
+                status, _ = await request(reader, writer, "GET", random.choice(reads))
+            results.append((kind, status, time.perf_counter() - start))
+    finally:
+        writer.close()
+
+
+def report(kind, durations, elapsed):
+    """Print count, requests per second, p50 and p99 of a list of durations in seconds"""
+    if not durations:
+        return
+    durations = sorted(durations)
+    p99 = durations[min(int(len(durations) * 0.99), len(durations) - 1)]
+    print(
+        f"{kind:<6}{len(durations):>8} requests {len(durations) / elapsed:>9.1f} req/s"
+        f"   p50 {statistics.median(durations) * 1000:8.2f} ms   p99 {p99 * 1000:8.2f} ms"
+    )
+
+
+async def run(url, skillname, clients, requests, write_ratio):
+    """Run the clients at the same time and print the results"""
+    address = urllib.parse.urlsplit(url)
+    host, port = address.hostname, address.port or 80
+    if skillname is None:
+        reader, writer = await asyncio.open_connection(host, port)
+        _, skills = await request(reader, writer, "GET", "/skills")
+        writer.close()
+        if not skills:
+            raise SystemExit("The server has no skills yet, add one in the settings menu first.")
+        skillname = skills[0]
+    results = []
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(
+            client(host, port, skillname, requests // clients, write_ratio, results)
+            for _ in range(clients)
+        )
+    )
+    elapsed = time.perf_counter() - start
+    print(f"{clients} clients, {len(results)} requests for {skillname} in {elapsed:.2f} s\n")
+    for kind in ("read", "write"):
+        report(kind, [seconds for name, _, seconds in results if name == kind], elapsed)
+    report("all", [seconds for *_, seconds in results], elapsed)
+    errors = [status for _, status, _ in results if status != 200]
+    if errors:
+        print(f"\n{len(errors)} requests failed, statuses {sorted(set(errors))}")
+
+
+def parse_args():
+    """Parse the options of the load test"""
+    parser = argparse.ArgumentParser(description="Load test for the LevelUp api")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--skill", help="skill to log and read, default the first one")
+    parser.add_argument("--clients", type=int, default=20, help="connections at the same time")
+    parser.add_argument("--requests", type=int, default=5000, help="requests of all clients")
+    parser.add_argument(
+        "--write-ratio", type=float, default=0.1, help="part of the requests that log minutes"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    asyncio.run(run(args.url, args.skill, args.clients, args.requests, args.write_ratio))
@@ -1,53 +1,38 @@
 # File that ties all the other functions and models together
 # Runs the main programm
 
-import datetime
-import shutil
-from sqlalchemy import create_engine
-
-# import everything that is needed from selfmade modules
-from models import *
-from menues import main_menu
-from output import output_summary, show_stats
-
-
-os.makedirs(BASE + os.sep + "db", exist_ok=True)
-Base.metadata.create_all(engine)
+# the selfmade modules are imported where they are needed, so the program starts fast:
+# matplotlib is only loaded for graphs, inquirer only for the menues
+from cli import parse_args, prepare_database, run, start_tracing
 
 
 def main():
     """Main programm - ties the database together with the frontend for the user"""
+    from instrument import action
+    from menues import main_menu
+    from models import log_minutes, minute_input
+    from output import output_summary
+
     while True:
         # main loop
         skill_choice = None
         while skill_choice is None:
             # main menu_loop
             skill_choice = main_menu()
-        entry = Entry()  # instantiate a new entry
-        entry.add_null_date(skill_choice)  # fill in 0 days
-        entry.create_entry(skill_choice)  # create a new entry with minutes
-        # get total minutes invested in skill today
-        minutes_invested = entry.get_minutes_invested(skill_choice)
-        # get hours in total in the skill
-        total_hours = round(entry.get_total_minutes(skill_choice) / 60, 2)
-        # update the level of the skill
-        current_level, next_level, xp_points, xp_required, goal = update_level(
-            skillname=skill_choice
-        )
-        # give main output for the user
-        output_summary(
-            skillname=skill_choice,
-            current_level=current_level,
-            next_level=next_level,
-            xp_points=xp_points,
-            xp_required=xp_required,
-            minutes_invested=minutes_invested,
-            total_hours=total_hours,
-            goal=goal,
-        )
+        minutes = minute_input()
+        with action("log"):
+            # add the minutes and update the level in one go, get back what changed
+            summary = log_minutes(skill_choice, minutes)
+            # give main output for the user
+            output_summary(summary)
         input("\n\nPress ENTER to continue...")
 
 
 if __name__ == "__main__":
-    # import_db()
-    main()
+    args = parse_args()
+    if args.command or args.profile_startup:
+        run(args)  # commands for scripts, see cli.py
+    else:
+        start_tracing(args)
+        prepare_database()
+        main()
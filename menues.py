@@ -1,24 +1,21 @@
 # This file gives the menues and does the appropriate actions for the selections
 # Some other functions are included to reduce clutter and imports
 
-import datetime
 import os
-import shutil
 import inquirer
 
-# import from other self-made modules
-from graphs import *
+# import from other self-made modules, graphs are imported when one is shown
 from models import (
     get_dates_and_hours,
+    get_rollup_series,
     get_skill_names,
     create_skill,
     set_goal,
     get_stats,
     delete_skill,
-    BASE,
-    DATABASE,
 )
-from output import lvlup_help, show_stats
+from instrument import action
+from output import lvlup_help, show_range_stats, show_stats, show_weeks
 
 
 def main_menu():
@@ -82,6 +79,7 @@ def settings_menu():
         "Delete a skill",
         "Set a daily goal",
         "Create backup",
+        "Restore backup",
         "Display Help",
         "Go Back",
     ]
@@ -104,7 +102,8 @@ def settings_menu():
         # confirmation to delete the skill
         key = input(f"Are you 100% sure you want to delete {skillname}? [y/N] ")
         if key.lower() == "y":
-            delete_skill(skillname)  # actually delete the skill
+            with action("delete"):
+                delete_skill(skillname)  # actually delete the skill
             # give user feedback
             input(f"Deleted {skillname}\nPress ENTER to continue...")
     elif choice == menu_options[2]:
@@ -114,11 +113,17 @@ def settings_menu():
         set_goal(skillname)  # call function to set goal in Skill model
     elif choice == menu_options[3]:
         # create a backup
-        file_path = backup_db()  # create backup and return filepath
+        from backup import create_backup
+
+        with action("backup"):
+            file_path = create_backup()  # create backup and return filepath
         # give user feedback, let them know where the backup is
         print(f"Backup successfully created at {file_path}")
         input("Press ENTER to continue...")
     elif choice == menu_options[4]:
+        # replace the database with a backup
+        restore_menu()
+    elif choice == menu_options[5]:
         # display the help string
         lvlup_help()
     elif choice == menu_options[-1]:
@@ -136,6 +141,8 @@ def insight_menu():
         "Graph: All Time",
         "Graph: Past Month",
         "Graph: Past Week",
+        "Stats: Date Range",
+        "Stats: Week over Week",
     ]
     menu = [
         # checkbox allows for multiple selections
@@ -164,22 +171,92 @@ def insight_menu():
         )
         input("Press ENTER to continue...")
         insight_menu()
+    elif insight == menu_options_2[0]:
+        clear_screen()
+        with action("stats"):
+            print(show_stats(get_stats(skill_list)))
+        input("Press ENTER to continue...")
+    elif insight == menu_options_2[4]:
+        first, last = date_range_menu()
+        clear_screen()
+        with action("stats"):
+            from ranges import range_stats
+
+            print(show_range_stats(range_stats(skill_list, first, last)))
+        input("Press ENTER to continue...")
+    elif insight == menu_options_2[5]:
+        clear_screen()
+        with action("stats"):
+            from ranges import week_over_week
+
+            for skillname in skill_list:
+                # the last 12 weeks, python main.py stats --from shows any range
+                print(show_weeks(skillname, week_over_week(skillname)[-12:]))
+        input("Press ENTER to continue...")
     else:
-        # call appropriate insight
-        skills_dict = get_dates_and_hours(skill_list)  # get data for selection
-        if insight == menu_options_2[0]:
-            clear_screen()
-            print(show_stats(get_stats(skills_dict)))
-            input("Press ENTER to continue...")
-        elif insight == menu_options_2[1]:
-            # all time progress
-            plot_cumulated_progress(skills_dict, start=0)
-        elif insight == menu_options_2[2]:
-            # monthly time investment
-            plot_minutes(skills_dict, start=-30)
-        elif insight == menu_options_2[3]:
-            # weekly time investment
-            plot_minutes(skills_dict, start=-7)
+        with action("graph"):
+            path = show_graph(skill_list, menu_options_2.index(insight))
+        if path:
+            input(f"The graph is at {path}\nPress ENTER to continue...")
+
+
+def show_graph(skill_list, choice):
+    """Show the graph of the insight menu, 1 all time, 2 past month, 3 past week.
+    Without a display it is written to a file, return its path then"""
+    # matplotlib takes a while to load, only do it for the graphs
+    from graphs import plot_cumulated_progress, plot_minutes
+    from render import has_display, render_graph
+
+    if not has_display():
+        # no window to show the graph in, e.g. over ssh, write it to a file
+        return render_graph(skill_list, ["all", "month", "week"][choice - 1])
+    if choice == 1:
+        # all time progress, from the weekly totals
+        plot_cumulated_progress(get_rollup_series(skill_list, "week"), start=0)
+    elif choice == 2:
+        # monthly time investment
+        plot_minutes(get_dates_and_hours(skill_list), start=-30)
+    elif choice == 3:
+        # weekly time investment
+        plot_minutes(get_dates_and_hours(skill_list), start=-7)
+    return None
+
+
+def date_range_menu():
+    """Let the user enter the first and last day of a range, default this year up to today.
+    Return both as dates"""
+    import datetime
+
+    today = datetime.date.today()
+    january = today.replace(month=1, day=1)
+
+    def is_date(answers, value):
+        try:
+            return not value or bool(datetime.date.fromisoformat(value))
+        except ValueError:
+            return False
+
+    def day(value, default):
+        return datetime.date.fromisoformat(value) if value else default
+
+    def is_last_day(answers, value):
+        # a range can't end before it starts
+        return is_date(answers, value) and day(value, today) >= day(answers["first"], january)
+
+    menu = [
+        inquirer.Text(
+            "first",
+            message="First day (YYYY-MM-DD), empty for January 1st",
+            validate=is_date,
+        ),
+        inquirer.Text(
+            "last",
+            message="Last day (YYYY-MM-DD), not before the first one, empty for today",
+            validate=is_last_day,
+        ),
+    ]
+    answers = inquirer.prompt(menu)
+    return day(answers["first"], january), day(answers["last"], today)
 
 
 def clear_screen():
@@ -187,20 +264,35 @@ def clear_screen():
     os.system("cls" if os.name == "nt" else "clear")
 
 
-def backup_db():
-    """Create a backup of the database"""
-    # contruct filepath and name for backup
-    new_backup = (
-        BASE
-        + os.sep
-        + "db"
-        + os.sep
-        + "backup-"
-        + datetime.datetime.now().strftime("%Y-%m-%d")
-        + ".db"
-    )
-    # copy the existing database to new filename
-    shutil.copy2(
-        DATABASE, new_backup,
-    )
-    return new_backup
+def restore_menu():
+    """Let the user pick a backup and restore it"""
+    from backup import list_backups, restore_backup
+
+    backups = {
+        created.strftime("%Y-%m-%d %H:%M:%S"): path for created, path in list_backups()
+    }
+    if not backups:
+        input("There are no backups yet.\nPress ENTER to continue...")
+        return
+    menu = [
+        inquirer.List(
+            "backup",
+            message="Pick a backup",
+            choices=list(backups) + ["Go Back"],
+            carousel=True,
+        ),
+    ]
+    choice = inquirer.prompt(menu)["backup"]
+    if choice == "Go Back":
+        return
+    # confirmation to replace the database
+    key = input(f"Replace all your progress with the backup of {choice}? [y/N] ")
+    if key.lower() == "y":
+        try:
+            with action("restore"):
+                safety = restore_backup(backups[choice])
+        except ValueError as error:
+            print(error)
+        else:
+            print(f"Restored the backup of {choice}, your progress before is in {safety}")
+        input("Press ENTER to continue...")
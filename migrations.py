@@ -0,0 +1,125 @@
+# Versioned schema migrations, so existing databases are upgraded in place
+# The version of a database is stored in the schema_version table
+
+from models import Base, WEEK_START_SQL, MONTH_START_SQL
+
+# all migrations in the order they are applied: (version, description, statements)
+# every statement can run again safely, in case a migration was interrupted
+MIGRATIONS = [
+    (
+        1,
+        "unique index on entries (skill, date)",
+        [
+            # merge the minutes of days that were stored more than once
+            """UPDATE entries SET minutes = (
+                SELECT SUM(duplicate.minutes) FROM entries AS duplicate
+                WHERE duplicate.skill = entries.skill AND duplicate.date = entries.date
+            ) WHERE id IN (
+                SELECT MIN(id) FROM entries GROUP BY skill, date HAVING COUNT(*) > 1
+            )""",
+            "DELETE FROM entries WHERE id NOT IN (SELECT MIN(id) FROM entries GROUP BY skill, date)",
+            "CREATE UNIQUE INDEX IF NOT EXISTS ix_entries_skill_date ON entries (skill, date)",
+        ],
+    ),
+    (
+        2,
+        "weekly and monthly rollups",
+        [
+            """CREATE TABLE IF NOT EXISTS skill_weekly (
+                skill VARCHAR NOT NULL REFERENCES skills (name),
+                period_start DATE NOT NULL,
+                minutes INTEGER,
+                PRIMARY KEY (skill, period_start)
+            )""",
+            """CREATE TABLE IF NOT EXISTS skill_monthly (
+                skill VARCHAR NOT NULL REFERENCES skills (name),
+                period_start DATE NOT NULL,
+                minutes INTEGER,
+                PRIMARY KEY (skill, period_start)
+            )""",
+            f"""INSERT OR REPLACE INTO skill_weekly (skill, period_start, minutes)
+            SELECT skill, {WEEK_START_SQL}, SUM(minutes) FROM entries
+            WHERE minutes != 0 GROUP BY 1, 2""",
+            f"""INSERT OR REPLACE INTO skill_monthly (skill, period_start, minutes)
+            SELECT skill, {MONTH_START_SQL}, SUM(minutes) FROM entries
+            WHERE minutes != 0 GROUP BY 1, 2""",
+        ],
+    ),
+    (
+        3,
+        "streaks and recent minutes of every skill",
+        [
+            # filled in from the entries at the next log of a skill, or with rebuild-streaks
+            """CREATE TABLE IF NOT EXISTS skill_streaks (
+                skill VARCHAR NOT NULL REFERENCES skills (name),
+                last_date DATE,
+                last_minutes INTEGER,
+                streak_before INTEGER,
+                goal_streak_before INTEGER,
+                longest_before INTEGER,
+                recent VARCHAR,
+                PRIMARY KEY (skill)
+            )""",
+        ],
+    ),
+    (
+        4,
+        "data version, so other processes notice writes",
+        [
+            """CREATE TABLE IF NOT EXISTS data_version (
+                id INTEGER NOT NULL,
+                version INTEGER,
+                PRIMARY KEY (id)
+            )""",
+        ],
+    ),
+    (
+        5,
+        "watermarks of the 0 days",
+        [
+            """CREATE TABLE IF NOT EXISTS skill_filled (
+                skill VARCHAR NOT NULL REFERENCES skills (name),
+                filled_from DATE,
+                filled_until DATE,
+                PRIMARY KEY (skill)
+            )""",
+        ],
+    ),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_version(connection):
+    """Return the schema version of the database, 0 for databases without a version"""
+    version = connection.execute("SELECT MAX(version) FROM schema_version").scalar()
+    return version or 0
+
+
+def set_version(connection, version):
+    """Store the schema version of the database"""
+    connection.execute("INSERT INTO schema_version (version) VALUES (?)", (version,))
+
+
+def migrate(engine):
+    """Bring the database up to the latest schema version. Return the list of applied migrations"""
+    applied = []
+    with engine.begin() as connection:
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"
+        )
+        version = get_version(connection)
+        # a new database gets the latest schema right away
+        if version == 0 and not engine.dialect.has_table(connection, "entries"):
+            Base.metadata.create_all(connection)
+            set_version(connection, LATEST_VERSION)
+            return applied
+        # databases from older versions are upgraded one migration at a time
+        for migration_version, description, statements in MIGRATIONS:
+            if migration_version <= version:
+                continue
+            for statement in statements:
+                connection.execute(statement)
+            set_version(connection, migration_version)
+            applied.append(description)
+    return applied
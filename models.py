@@ -1,20 +1,83 @@
 # File for everything related to the database to track progress
 
+import collections
 import datetime
+import functools
+import itertools
 import os
-import sys
-import shutil
-
-from sqlalchemy import Column, String, Integer, Date, ForeignKey, create_engine
+import random
+import time
+
+from sqlalchemy import (
+    Column,
+    String,
+    Integer,
+    Date,
+    ForeignKey,
+    Index,
+    and_,
+    bindparam,
+    case,
+    create_engine,
+    event,
+    func,
+    text,
+)
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-
-# setting up the engine for the database and some constants
-BASE = os.path.dirname(sys.argv[0])
-DATABASE = BASE + os.sep + "db/level.db"
-engine = create_engine("sqlite:///" + DATABASE)
-Session = sessionmaker(bind=engine)  # instantiate a session and connect it to our db
-session = Session()
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool, StaticPool
+
+import cache
+from cache import CACHE, bump, logged, memoize, seen
+from config import as_boolean, as_numbers, load_config
+import streaks
+from levels import make_curve
+
+# setting up the storage from the config file and the environment, see config.py
+SETTINGS = load_config()
+DATABASE_URL = SETTINGS["database_url"]
+DATABASE = make_url(DATABASE_URL).database  # path of the sqlite file, if there is one
+PROFILE = SETTINGS["profile"]
+# only store days with minutes in them, days without entries are filled in when reading
+SPARSE_ENTRIES = as_boolean(SETTINGS["sparse_entries"])
+# curve that decides how many hours it takes to reach the next level, see levels.py
+if SETTINGS["level_curve"] == "table":
+    LEVEL_CURVE = make_curve("table", as_numbers(SETTINGS["level_curve_args"]))
+else:
+    LEVEL_CURVE = make_curve(
+        SETTINGS["level_curve"], *as_numbers(SETTINGS["level_curve_args"])
+    )
+
+# milliseconds a connection waits for the lock of another one, before the write is retried
+BUSY_TIMEOUT = int(SETTINGS["busy_timeout"])
+# times a write is retried when the database stays locked, see retry_when_busy
+BUSY_RETRIES = int(SETTINGS["busy_retries"])
+
+# most results kept in the cache of series, stats and levels, see cache.py
+CACHE.max_size = int(SETTINGS["cache_size"])
+
+# pragmas for every new sqlite connection, chosen with the profile setting
+PRAGMA_PROFILES = {
+    # sqlite defaults: rollback journal and a full sync on every commit
+    "default": {},
+    # write ahead log, readers don't block the writer, still a full sync on commit
+    "safe": {"journal_mode": "WAL", "synchronous": "FULL"},
+    # write ahead log with less syncing, bigger caches and memory mapped reads
+    "performance": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 268435456,  # 256 MB
+        "cache_size": -65536,  # 64 MB
+        "temp_store": "MEMORY",
+    },
+}
+
+engine = None  # created on first use, see get_engine
+Session = sessionmaker()
+# the session is only created when it is first used, one per thread
+session = scoped_session(lambda: Session(bind=get_engine()))
 
 # instantiating the base for the models
 Base = declarative_base()
@@ -23,7 +86,86 @@ Base = declarative_base()
 def setup_database():
     """Create the directory for the database.
     Make sure the directory exists"""
-    os.makedirs(BASE + os.sep + "db", exist_ok=True)
+    if DATABASE and DATABASE != ":memory:":
+        os.makedirs(os.path.dirname(os.path.abspath(DATABASE)), exist_ok=True)
+
+
+def apply_pragmas(dbapi_connection, connection_record):
+    """Apply the pragmas of the profile to a new sqlite connection"""
+    cursor = dbapi_connection.cursor()
+    # first, switching to the write ahead log needs the lock as well
+    cursor.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT}")
+    for pragma, value in PRAGMA_PROFILES[PROFILE].items():
+        cursor.execute(f"PRAGMA {pragma} = {value}")
+    cursor.close()
+
+
+def get_engine():
+    """Return the engine for the database, create it on first use"""
+    global engine
+    if engine is None:
+        if PROFILE not in PRAGMA_PROFILES:
+            raise ValueError(
+                f"Unknown profile {PROFILE}, choose from {', '.join(PRAGMA_PROFILES)}"
+            )
+        url = make_url(DATABASE_URL)
+        # the queries use sqlite sql, like INSERT OR IGNORE, date() and VACUUM
+        if url.get_backend_name() != "sqlite":
+            raise ValueError(
+                f"LevelUp only works with sqlite, {url.get_backend_name()} is not supported: "
+                "use a sqlite:/// url in database_url"
+            )
+        if DATABASE in (None, "", ":memory:"):
+            # an in memory database only lives as long as its connection, so share it
+            options = {
+                "connect_args": {"check_same_thread": False},
+                "poolclass": StaticPool,
+            }
+        else:
+            # keep the connections of a sqlite file open, the server checks them out in threads
+            options = {
+                "connect_args": {"check_same_thread": False},
+                "poolclass": QueuePool,
+                "pool_size": int(SETTINGS["pool_size"]),
+            }
+        setup_database()
+        engine = create_engine(url, **options)
+        event.listen(engine, "connect", apply_pragmas)
+    return engine
+
+
+def retry_when_busy(function):
+    """Run a write again when the database is locked by another connection (another terminal,
+    a script or the server), waiting a random and longer time before every new try"""
+
+    @functools.wraps(function)
+    def retried(*args, **kwargs):
+        for attempt in range(BUSY_RETRIES + 1):
+            try:
+                return function(*args, **kwargs)
+            except OperationalError as error:
+                session.rollback()
+                if attempt == BUSY_RETRIES or "locked" not in str(error.orig):
+                    raise
+                time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+
+    return retried
+
+
+def configure_storage(database_url=None, profile=None):
+    """Switch to another database or profile, default to the settings.
+    The engine and session are created again on their next use"""
+    global engine, DATABASE_URL, DATABASE, PROFILE
+    session.remove()
+    if engine is not None:
+        engine.dispose()
+    engine = None
+    DATABASE_URL = database_url or SETTINGS["database_url"]
+    DATABASE = make_url(DATABASE_URL).database
+    PROFILE = profile or SETTINGS["profile"]
+    CACHE.clear()  # the cached data is from the other database
+    cache.SEEN = None  # so is the data version, the new one can be lower
+    bump()  # so is data that is kept elsewhere with the versions, like the indexes of ranges.py
 
 
 class Entry(Base):
@@ -37,82 +179,89 @@ class Entry(Base):
     skill = Column(
         ForeignKey("skills.name"), nullable=False
     )  # name of the skill improved
+    # one entry per skill and day, also makes every lookup by skill and date fast
+    __table_args__ = (Index("ix_entries_skill_date", "skill", "date", unique=True),)
 
     @staticmethod
-    def add_null_date(skillname):
-        """Add days with no time spent in them, also activates every time a new entry is made"""
-        # get the first date for a skill in the db
-        start = (
-            session.query(Entry)
-            .filter_by(skill=skillname)
-            .order_by(Entry.date.asc())
-            .first()
-        )
-        # if there is a start, if not, just skip, because we don't need to add 0 days
-        if start is not None:
-            start = start.date
-            stop = datetime.datetime.now()  # stopping today
-            while start.strftime("%Y-%m-%d") != stop.strftime("%Y-%m-%d"):
-                # add one day
-                start = start + datetime.timedelta(days=1)
-                # if there is no entry for that day
-                if (
-                    session.query(Entry).filter_by(date=start, skill=skillname).first()
-                    is None
-                ):
-                    # add a new entry with 0 minutes in the skillname
-                    new_entry = Entry(date=start, minutes=0, skill=skillname)
-                    session.add(new_entry)
-                    session.commit()
+    def add_null_date(skillname, commit=True):
+        """Add days with no time spent in them, also activates every time a new entry is made.
+        Without commit the days are part of the transaction of the caller"""
+        # with sparse entries the 0 days are only filled in when reading
+        if SPARSE_ENTRIES:
+            return
+        today = datetime.date.today()  # stopping today
+        # the first date of the skill and its watermark, in one query
+        first, filled_from, filled_until = session.execute(
+            READ_FILLED, {"skill": skillname}
+        ).first()
+        # if there is no start, just skip, because we don't need to add 0 days
+        if first is None:
+            return
+        # start at the watermark if this skill was already filled up before,
+        # unless an entry was added before the filled days, e.g. by an import
+        if filled_from is None or first < filled_from:
+            start = first
+        else:
+            start = filled_until
+        if start < today:
+            # every day after the start up until today
+            days = [
+                {"date": start + datetime.timedelta(days=offset), "skill": skillname}
+                for offset in range(1, (today - start).days + 1)
+            ]
+            # add all the 0 days in one batch, days that already exist are kept
+            session.execute(INSERT_NULL_DATE, days)
+            # remember that there are no gaps up to today, also for the next run
+            session.execute(
+                SAVE_FILLED, {"skill": skillname, "filled_from": first, "filled_until": today}
+            )
+            if commit:
+                session.commit()
 
     @staticmethod
-    def create_entry(skillname):
-        """Supplementary table to the times_table. Keeps track of total hours invested, current level, next level"""
-        minutes = minute_input()  # verify input
-
-        # store query in variable for easy repetition
-        query_obj = session.query(Entry).filter_by(
-            skill=skillname, date=datetime.datetime.now().strftime("%Y-%m-%d")
-        )
-        # get first obj from the query
-        entry = query_obj.first()
-        # for newly created skills
-        if entry is None:
-            # create a new entry with the input minutes
-            entry = Entry(
-                skill=skillname, date=datetime.datetime.now(), minutes=minutes
-            )
-            session.add(entry)
-        else:
-            # add the minutes to the existing entry (either 0 day or something in it)
-            entry.minutes += minutes
-        session.commit()  # save changes to the database
+    def create_entry(skillname, minutes=None, date=None):
+        """Supplementary table to the times_table. Keeps track of total hours invested, current level, next level.
+        Without minutes the user is asked for them, without a date they are added to today.
+        Return the LogSummary, see log_minutes"""
+        if minutes is None:
+            minutes = minute_input()  # verify input
+        return log_minutes(skillname, minutes, date)
 
     @staticmethod
-    def get_minutes_invested(skillname):
-        """Return the number of minutes invested in a skill today"""
+    def get_minutes_invested(skillname, date=None):
+        """Return the number of minutes invested in a skill today (or on the given date)"""
         minutes = (
             session.query(Entry.minutes)
-            .filter_by(
-                skill=skillname, date=datetime.datetime.now().strftime("%Y-%m-%d")
-            )
-            .first()[0]
+            .filter_by(skill=skillname, date=date or datetime.date.today())
+            .scalar()
         )
-
-        return minutes
+        # with sparse entries there might not be a row for the day
+        return minutes or 0
 
     @staticmethod
     def get_total_minutes(skillname):
-        """Return the total number of minutes invested in a skill"""
-        entries = session.query(Entry.minutes).filter_by(skill=skillname).all()
-        total = 0
-        for entry in entries:
-            total += entry[0]  # add the minutes to the total
-        # update the total minues in the skill table
+        """Return the total number of minutes invested in a skill.
+        The total is kept up to date by create_entry, see rebuild_totals to recompute it"""
         skill_obj = session.query(Skill).get(skillname)
-        skill_obj.total_minutes = total  # update the total in the Skill model
-        session.commit()  # save changes to the db
-        return total  # return the total for main.py
+        return skill_obj.total_minutes or 0  # return the total for main.py
+
+
+# add minutes to the entry of a skill on a day, creates the entry if there is none
+UPSERT_ENTRY = text(
+    "INSERT INTO entries (skill, date, minutes) VALUES (:skill, :date, :minutes) "
+    "ON CONFLICT (skill, date) DO UPDATE SET minutes = minutes + excluded.minutes"
+).bindparams(bindparam("date", type_=Date))
+# add minutes to the total of a skill
+ADD_TO_TOTAL = text(
+    "UPDATE skills SET total_minutes = COALESCE(total_minutes, 0) + :minutes WHERE name = :skill"
+)
+SET_LEVEL = text(
+    "UPDATE skills SET current_level = :level, xp_points = :xp_points WHERE name = :skill"
+)
+# add a 0 day for a skill, unless there already is an entry on that day
+INSERT_NULL_DATE = (
+    Entry.__table__.insert().prefix_with("OR IGNORE").values(minutes=0)
+)
 
 
 class Skill(Base):
@@ -127,6 +276,121 @@ class Skill(Base):
     daily_goal = Column(Integer, default=0)  # number of minutes to reach every day
 
 
+class FilledDays(Base):
+    """Class for the watermark of the 0 days of a skill, with dense entries every day from
+    filled_from until filled_until has an entry. See Entry.add_null_date"""
+
+    __tablename__ = "skill_filled"
+
+    skill = Column(ForeignKey("skills.name"), primary_key=True)  # name of the skill
+    filled_from = Column(Date)  # first entry of the skill when the days were filled
+    filled_until = Column(Date)  # last day that was filled
+
+
+# the first date of a skill with its watermark
+READ_FILLED = text(
+    "SELECT (SELECT MIN(date) FROM entries WHERE skill = :skill) AS first, "
+    "(SELECT filled_from FROM skill_filled WHERE skill = :skill) AS filled_from, "
+    "(SELECT filled_until FROM skill_filled WHERE skill = :skill) AS filled_until"
+).columns(first=Date, filled_from=Date, filled_until=Date)
+SAVE_FILLED = text(
+    "INSERT OR REPLACE INTO skill_filled (skill, filled_from, filled_until) "
+    "VALUES (:skill, :filled_from, :filled_until)"
+).bindparams(bindparam("filled_from", type_=Date), bindparam("filled_until", type_=Date))
+
+
+class DataVersion(Base):
+    """Class for the data version, a counter that goes up with every write to the database.
+    Other processes compare it with the version they saw last, see cache.seen"""
+
+    __tablename__ = "data_version"
+
+    id = Column(Integer, primary_key=True)  # there is only one row, with id 1
+    version = Column(Integer, default=0)  # number of writes
+
+
+# count a write, in the transaction of the write, creates the row on the first one
+COUNT_WRITE = text(
+    "INSERT INTO data_version (id, version) VALUES (1, 1) "
+    "ON CONFLICT (id) DO UPDATE SET version = version + 1"
+)
+SET_DATA_VERSION = text(
+    "INSERT INTO data_version (id, version) VALUES (1, :version) "
+    "ON CONFLICT (id) DO UPDATE SET version = excluded.version"
+)
+READ_DATA_VERSION = text("SELECT version FROM data_version WHERE id = 1")
+
+
+def read_data_version():
+    """Return the data version of the database, 0 before the first write"""
+    return session.execute(READ_DATA_VERSION).scalar() or 0
+
+
+def count_write():
+    """Count a write in the data version, before the commit of the write.
+    Return the new version for bump, so this process doesn't take its own write for another one"""
+    session.execute(COUNT_WRITE)
+    return read_data_version()
+
+
+def check_data_version():
+    """Forget the cached data and the loaded skills if another process wrote to the database"""
+    if seen(read_data_version()):
+        session.expire_all()
+
+
+cache.VERSION_CHECK = check_data_version
+
+
+class WeeklyRollup(Base):
+    """Class for the total minutes of a skill in every week, kept up to date with the entries"""
+
+    __tablename__ = "skill_weekly"
+
+    skill = Column(ForeignKey("skills.name"), primary_key=True)  # name of the skill
+    period_start = Column(Date, primary_key=True)  # monday of the week
+    minutes = Column(Integer, default=0)  # total minutes in the week
+
+
+class MonthlyRollup(Base):
+    """Class for the total minutes of a skill in every month, kept up to date with the entries"""
+
+    __tablename__ = "skill_monthly"
+
+    skill = Column(ForeignKey("skills.name"), primary_key=True)  # name of the skill
+    period_start = Column(Date, primary_key=True)  # first day of the month
+    minutes = Column(Integer, default=0)  # total minutes in the month
+
+
+class SkillStreak(Base):
+    """Class for the streaks and the recent minutes of a skill, moved forward with every log.
+    See streaks.py, a skill without a row gets it from its entries at the next log"""
+
+    __tablename__ = "skill_streaks"
+
+    skill = Column(ForeignKey("skills.name"), primary_key=True)  # name of the skill
+    last_date = Column(Date)  # last day with minutes
+    last_minutes = Column(Integer, default=0)  # minutes on that day
+    streak_before = Column(Integer, default=0)  # days with minutes in a row before it
+    goal_streak_before = Column(Integer, default=0)  # days with the goal reached in a row before it
+    longest_before = Column(Integer, default=0)  # longest streak before it
+    recent = Column(String)  # minutes of the last 30 days up to last_date, separated by commas
+
+
+# SQL expressions for the first day of the week (monday) and the month of an entry
+WEEK_START_SQL = "date(date, '-' || ((strftime('%w', date) + 6) % 7) || ' days')"
+MONTH_START_SQL = "date(date, 'start of month')"
+# for every rollup: the model, the first day of the period for a date and the SQL for it
+ROLLUPS = {
+    "week": (
+        WeeklyRollup,
+        lambda day: day - datetime.timedelta(days=day.weekday()),
+        WEEK_START_SQL,
+    ),
+    "month": (MonthlyRollup, lambda day: day.replace(day=1), MONTH_START_SQL),
+}
+
+
 def minute_input():
     """Verfiy the input of the user to only allow integers above 0"""
     while True:
@@ -143,12 +407,22 @@ def minute_input():
 
 def set_goal(skillname):
     """Let the user change the goal setting for a skill"""
+    minutes = minute_input()  # let the user input minutes
+    save_goal(skillname, minutes)
+
+
+@retry_when_busy
+def save_goal(skillname, minutes):
+    """Change the daily goal of a skill"""
     skill_obj = session.query(Skill).get(
         skillname
     )  # get the skill from the Skill model
-    minutes = minute_input()  # let the user input minutes
     skill_obj.daily_goal = minutes  # update the daily goal in Skill model
+    # the goal streak is counted with the new goal, also for the days before
+    save_streak(skillname, history_streak(skillname, minutes))
+    version = count_write()
     session.commit()  # commit changes to database
+    bump(skillname, version)
 
 
 def create_skill():
@@ -176,40 +450,148 @@ def create_skill():
     session.commit()  # save changes to database
 
 
+def find_skill(skillname):
+    """Return the name of the skill as it is stored, for a name in any case.
+    Returns None if there is no such skill"""
+    skillname = skillname.strip().lower().title()  # the way create_skill stores names
+    if session.query(Skill.name).filter_by(name=skillname).scalar() is None:
+        return None
+    return skillname
+
+
 def get_skill_names():
     """Returns a list of all names for the skills in the level_table"""
     skill_names = [instance.name for instance in session.query(Skill)]
     return skill_names
 
 
-def update_level(skillname):
-    """
-    Update the level.db after new minutes have been entered,
-    to calculate current level as well as next level"""
-
-    skill_obj = session.query(Skill).get(skillname)
-    total_hours = skill_obj.total_minutes / 60  # convert minutes to hours
-    # logic for the level up calculation
-    next_level = 1
-    current_level = 0
-    # check if there was a levelup
-    while total_hours >= (next_level ** 2):
-        current_level = next_level
-        total_hours -= next_level ** 2
-        next_level += 1
-    xp_points = round(total_hours, 2)
-    # Update the DB
-    skill_obj.xp_points = xp_points
-    skill_obj.current_level = current_level
-    xp_required = round((next_level ** 2) - xp_points, 1)
-    session.commit()  # save changes to Skill model
-    return (
-        skill_obj.current_level,
-        next_level,
-        xp_points,
-        xp_required,
-        skill_obj.daily_goal,
-    )  # return for main.py
+# what changed after minutes were logged, for output_summary
+LogSummary = collections.namedtuple(
+    "LogSummary",
+    [
+        "skill",
+        "date",
+        "minutes_invested",  # minutes on the day, with the new ones
+        "current_level",
+        "next_level",
+        "xp_points",
+        "xp_required",
+        "total_hours",
+        "goal",
+        # see streaks.Streaks
+        "current_streak",
+        "longest_streak",
+        "goal_streak",
+        "average_week",
+        "average_month",
+    ],
+)
+
+
+@retry_when_busy
+def log_minutes(skillname, minutes, date=None):
+    """Add minutes to a skill on a day (default today) and update the level of the skill.
+    Everything is saved in one transaction, or nothing if something fails. Return a LogSummary"""
+    date = date or datetime.date.today()
+    try:
+        # the total is added up in sql, not read and written back, so logs at the same time
+        # can't overwrite each other. As the first write it also locks the database until commit
+        added = session.execute(ADD_TO_TOTAL, {"skill": skillname, "minutes": minutes})
+        if not added.rowcount:
+            raise ValueError(f"There is no skill {skillname}")
+        Entry.add_null_date(skillname, commit=False)  # fill in 0 days
+        # nothing to store for an empty day with sparse entries
+        if minutes or not SPARSE_ENTRIES:
+            # create the entry for the day or add the minutes to the existing one
+            entry = {"skill": skillname, "date": date, "minutes": minutes}
+            session.execute(UPSERT_ENTRY, entry)
+            add_to_rollups([entry])
+        # update the level with the new total
+        total_minutes, goal = (
+            session.query(Skill.total_minutes, Skill.daily_goal).filter_by(name=skillname).one()
+        )
+        current_level, next_level, xp_points, xp_required = calculate_level(total_minutes)
+        session.execute(
+            SET_LEVEL, {"skill": skillname, "level": current_level, "xp_points": xp_points}
+        )
+        streak = update_streak(skillname, date, minutes, goal)
+        summary = LogSummary(
+            skill=skillname,
+            date=date,
+            minutes_invested=Entry.get_minutes_invested(skillname, date),
+            current_level=current_level,
+            next_level=next_level,
+            xp_points=xp_points,
+            xp_required=xp_required,
+            total_hours=round(total_minutes / 60, 2),
+            goal=goal,
+            **streak._asdict(),
+        )
+        version = count_write()
+        session.commit()  # save entry, rollups and skill at once
+    except BaseException:
+        session.rollback()
+        raise
+    logged(skillname, date, minutes, version)  # the cached data of the skill is out of date
+    return summary
+
+
+@memoize
+def get_level(skillname):
+    """Return current level, next level, xp points, xp required,
+    total minutes and daily goal of a skill, with a single query"""
+    total_minutes, goal = (
+        session.query(Skill.total_minutes, Skill.daily_goal).filter_by(name=skillname).one()
+    )
+    total_minutes = total_minutes or 0
+    return (*calculate_level(total_minutes), total_minutes, goal)
+
+
+def calculate_level(total_minutes):
+    """Return current level, next level, xp points and xp required for the total minutes"""
+    return LEVEL_CURVE.calculate(total_minutes)
+
+
+def sum_minutes():
+    """Return a dictionary with the sum of all entries for every skill, with a single query"""
+    totals = {name: 0 for name in get_skill_names()}
+    query = session.query(Entry.skill, func.sum(Entry.minutes)).group_by(Entry.skill)
+    for skillname, total in query:
+        totals[skillname] = total or 0
+    return totals
+
+
+def check_totals(totals=None):
+    """Compare the stored totals in the Skill model with the sum of the entries.
+    Return a dictionary of the skills that drifted with (stored total, actual total)"""
+    if totals is None:
+        totals = sum_minutes()
+    drift = {}
+    for skill_obj in session.query(Skill):
+        if (skill_obj.total_minutes or 0) != totals[skill_obj.name]:
+            drift[skill_obj.name] = (skill_obj.total_minutes, totals[skill_obj.name])
+    return drift
+
+
+@retry_when_busy
+def rebuild_totals():
+    """Recompute total minutes, level and xp points of every skill from the entries.
+    Return the drift that was fixed, see check_totals"""
+    totals = sum_minutes()
+    drift = check_totals(totals)
+    skill_objs = session.query(Skill).all()
+    # calculate the levels of all skills in one go
+    levels, _, xp_points, _ = LEVEL_CURVE.calculate_all(
+        [totals[skill_obj.name] for skill_obj in skill_objs]
+    )
+    for skill_obj, level, xp in zip(skill_objs, levels, xp_points):
+        skill_obj.total_minutes = totals[skill_obj.name]
+        skill_obj.current_level = int(level)
+        skill_obj.xp_points = float(xp)
+    version = count_write()
+    session.commit()  # save all skills at once
+    bump(version=version)  # levels of every skill might have changed
+    return drift
 
 
 def convert_datetime_objs(dates_list):
@@ -221,130 +603,307 @@ def convert_datetime_objs(dates_list):
     return datetime_list
 
 
+@memoize
 def get_dates_and_hours(skill_list):
-    """Get a dictionary of skills with dates, hours and goal for the plots"""
+    """Get a dictionary of skills with a SkillSeries of their minutes for every day, see series.py"""
+    # entries of all the skills in one query, sorted by skill and date
+    rows = (
+        session.query(Skill.name, Skill.daily_goal, Entry.date, Entry.minutes)
+        .outerjoin(Entry, Entry.skill == Skill.name)
+        .filter(Skill.name.in_(skill_list))
+        .order_by(Skill.name, Entry.date)
+        .all()
+    )
+    return split_series(rows)
+
+
+def split_series(rows, period="day"):
+    """Split rows of (skill, goal, date, minutes), sorted by skill and date, into a dictionary
+    of skills with their SkillSeries. The dates are filled in for every period"""
+    from series import SkillSeries  # numpy is not needed to log minutes, so only loaded here
+
     skills = {}
-    for skillname in skill_list:
-        dates_list = []
-        hours_list = []
-        skill_obj = session.query(Skill).get(skillname)
-        dates = (
-            session.query(Entry.date)
-            .filter_by(skill=skillname)
-            .order_by(Entry.date.asc())
-            .all()
+    start = 0
+    while start < len(rows):
+        # the rows of each skill are next to each other
+        name, goal = rows[start][:2]
+        stop = start
+        while stop < len(rows) and rows[stop][0] == name:
+            stop += 1
+        # a skill without entries has a single row without a date
+        entries = rows[start:stop] if rows[start][2] is not None else []
+        skills[name] = SkillSeries.from_entries(
+            [row[2] for row in entries], [row[3] for row in entries], goal, period
         )
-        hours = (
-            session.query(Entry.minutes)
-            .filter_by(skill=skillname)
-            .order_by(Entry.date.asc())
-            .all()
-        )
-        for date in dates:
-            dates_list.append(date[0])
-        for hour in hours:
-            hours_list.append(hour[0])
-
-        skills[skillname] = {
-            "dates": dates_list,
-            "minutes": hours_list,
-            "goal": skill_obj.daily_goal,
-        }
-
-    # return the dictionary with skill, dates and minutes
-    return skills
+        start = stop
 
+    # return the dictionary with skill and series
+    return skills
 
-def import_db():
-    """import an existing db from json file
-    Not used in the main programm, only for dev purposes"""
-    import json
-
-    with open("/home/alex/python/times.json") as json_file:
-        json_file = json_file.read()
-    jfile = json.loads(json_file)
-    for entry in jfile:
-        new_entry = Entry(
-            date=datetime.datetime.strptime(entry["date"], "%Y-%m-%d"),
-            minutes=entry["minutes"],
-            skill=entry["skill"],
-        )
-        session.add(new_entry)
-    session.commit()
 
+def add_to_rollups(entries):
+    """Add the minutes of new entries (dicts with skill, date and minutes) to the rollups.
+    Does not commit, so the rollups are saved together with the entries"""
+    for model, period_start, _ in ROLLUPS.values():
+        # add up the minutes of every period first, one upsert per period
+        totals = {}
+        for entry in entries:
+            if entry["minutes"]:
+                key = (entry["skill"], period_start(entry["date"]))
+                totals[key] = totals.get(key, 0) + entry["minutes"]
+        if totals:
+            session.execute(
+                text(
+                    f"INSERT INTO {model.__tablename__} (skill, period_start, minutes) "
+                    "VALUES (:skill, :period_start, :minutes) "
+                    "ON CONFLICT (skill, period_start) "
+                    "DO UPDATE SET minutes = minutes + excluded.minutes"
+                ).bindparams(bindparam("period_start", type_=Date)),
+                [
+                    {"skill": skill, "period_start": start, "minutes": minutes}
+                    for (skill, start), minutes in totals.items()
+                ],
+            )
 
-def get_stats(skill_dict):
-    """Return the necessary datapoints to show the stats"""
-    skill_list = [k for k in skill_dict.keys()]
 
-    stats_dict = {}
-    for skillname in skill_list:
-        # get all entries for a particular skill
-        query = (
-            session.query(Entry.minutes)
-            .filter_by(skill=skillname)
-            .order_by(Entry.date.desc())
-            .all()
+@retry_when_busy
+def rebuild_rollups():
+    """Regenerate the weekly and monthly rollups from the entries"""
+    for model, _, period_start_sql in ROLLUPS.values():
+        session.query(model).delete(synchronize_session=False)
+        session.execute(
+            f"INSERT INTO {model.__tablename__} (skill, period_start, minutes) "
+            f"SELECT skill, {period_start_sql}, SUM(minutes) FROM entries "
+            "WHERE minutes != 0 GROUP BY 1, 2"
         )
-        # if there are datapoints for 2 months or more
-        if len(query) >= 60:
-            stats_dict[skillname] = {
-                "last_week": total_interval(query, 0, 7),
-                "previous_week": total_interval(query, 7, 14),
-                "total_goals_week": goal_met(skillname, query, 0, 7),
-                "last_month": total_interval(query, 0, 30),
-                "previous_month": total_interval(query, 30, 60),
-                "total_goals_month": goal_met(skillname, query, 0, 30),
-            }
-        # if there are only datapoints for 2 weeks to 2 months
-        elif len(query) >= 14:
-            stats_dict[skillname] = {
-                "last_week": total_interval(query, 0, 7),
-                "previous_week": total_interval(query, 7, 14),
-                "total_goals_week": goal_met(skillname, query, 0, 7),
-                "last_month": None,
-                "previous_month": None,
-                "total_goals_month": None,
-            }
-        # if there are no datapoints at all
-        else:
-            stats_dict[skillname] = {
-                "last_week": None,
-                "previous_week": None,
-                "total_goals_week": None,
-                "last_month": None,
-                "previous_month": None,
-                "total_goals_month": None,
-            }
-
-        return stats_dict
-
-
-def goal_met(skillname, entries, start, stop):
-    """Check how many times the goal has been met in the time interval"""
-    total = 0
-    # get goal for the skill
-    skill_obj = session.query(Skill).get(skillname)
-    goal = skill_obj.daily_goal
-    for entry in entries[start:stop]:
-        if goal <= entry[0]:
-            total += 1
-    return total
-
-
-def total_interval(entries, start, stop):
-    """Return the total minutes for a given time range"""
-    total = 0
-    interval = [entry[0] for entry in entries[start:stop]]
-    for i in interval:
-        total += i
-    return total
-
+    version = count_write()
+    session.commit()  # save both rollups at once
+    bump(version=version)
+
+
+@memoize
+def get_rollup_series(skill_list, period="week"):
+    """Get a dictionary of skills with a SkillSeries from the rollups.
+    Like get_dates_and_hours, but with one value for every week or month"""
+    model = ROLLUPS[period][0]
+    # rollups of all the skills in one query, sorted by skill and period
+    rows = (
+        session.query(Skill.name, Skill.daily_goal, model.period_start, model.minutes)
+        .outerjoin(model, model.skill == Skill.name)
+        .filter(Skill.name.in_(skill_list))
+        .order_by(Skill.name, model.period_start)
+        .all()
+    )
+    return split_series(rows, period)
+
+
+# save the streak state of a skill, see streaks.StreakState
+SAVE_STREAK = text(
+    "INSERT OR REPLACE INTO skill_streaks (skill, last_date, last_minutes, streak_before, "
+    "goal_streak_before, longest_before, recent) VALUES (:skill, :last_date, :last_minutes, "
+    ":streak_before, :goal_streak_before, :longest_before, :recent)"
+).bindparams(bindparam("last_date", type_=Date))
+STREAK_COLUMNS = [getattr(SkillStreak, field) for field in streaks.StreakState._fields]
+# read the state of a skill, text is compiled faster than a query, it runs with every log
+READ_STREAK = text(
+    f"SELECT {', '.join(streaks.StreakState._fields)} FROM skill_streaks WHERE skill = :skill"
+).columns(last_date=Date)
+
+
+def to_streak_state(row):
+    """Turn a row of STREAK_COLUMNS into a StreakState"""
+    last_date, *numbers, recent = row
+    return streaks.StreakState(last_date, *numbers, tuple(map(int, recent.split(","))))
+
+
+def read_streak(skillname):
+    """Return the StreakState of a skill, None if there is none yet"""
+    row = session.execute(READ_STREAK, {"skill": skillname}).first()
+    return None if row is None else to_streak_state(row)
+
+
+def save_streak(skillname, state):
+    """Save the StreakState of a skill, None removes it. Does not commit"""
+    if state is None:
+        session.query(SkillStreak).filter_by(skill=skillname).delete(synchronize_session=False)
+        return
+    values = state._replace(recent=",".join(map(str, state.recent)))._asdict()
+    session.execute(SAVE_STREAK, dict(values, skill=skillname))
+
+
+def history_streak(skillname, goal):
+    """Compute the StreakState of a skill from all its entries"""
+    rows = (
+        session.query(Entry.date, Entry.minutes)
+        .filter(Entry.skill == skillname, Entry.minutes != 0)
+        .order_by(Entry.date)
+        .all()
+    )
+    # on the log path, where numpy is not loaded
+    return streaks.replay([row[0] for row in rows], [row[1] for row in rows], goal)
+
+
+def update_streak(skillname, date, minutes, goal):
+    """Move the streaks of a skill forward after minutes were logged, in the transaction of the log.
+    Only a skill without a state or a log before its last day reads the entries. Return the Streaks"""
+    state = read_streak(skillname)
+    if state is None:
+        state = history_streak(skillname, goal)  # the new minutes are already in the entries
+    else:
+        state = streaks.advance(state, date, minutes, goal) or history_streak(skillname, goal)
+    save_streak(skillname, state)
+    return streaks.summarize(state, goal, datetime.date.today())
+
+
+def compute_streaks(skill_list=None):
+    """Return the StreakState of every skill (default all) computed from the entries, in one query"""
+    query = session.query(Skill.name, Skill.daily_goal, Entry.date, Entry.minutes).outerjoin(
+        Entry, and_(Entry.skill == Skill.name, Entry.minutes != 0)
+    )
+    if skill_list is not None:
+        query = query.filter(Skill.name.in_(list(skill_list)))
+    states = {}
+    # the rows of each skill are next to each other, a skill without entries has one row without a date
+    rows = query.order_by(Skill.name, Entry.date).all()
+    for (skillname, goal), skill_rows in itertools.groupby(rows, key=lambda row: row[:2]):
+        days = [row[2:] for row in skill_rows if row[2] is not None]
+        states[skillname] = streaks.from_history(
+            [day for day, _ in days], [minutes for _, minutes in days], goal or 0
+        )
+    return states
+
+
+@retry_when_busy
+def rebuild_streaks(skill_list=None):
+    """Recompute the streaks of the skills (default all) from their entries, to repair or backfill them.
+    Return the drift that was fixed, see check_streaks"""
+    computed = compute_streaks(skill_list)
+    drift = check_streaks(computed)
+    for skillname, state in computed.items():
+        save_streak(skillname, state)
+    session.commit()  # nothing cached is made from the streaks, so no bump
+    return drift
+
+
+def check_streaks(computed=None):
+    """Compare the saved streaks with the ones computed from the entries (default of all skills).
+    Return a dictionary of the skills that drifted with (saved state, computed state)"""
+    if computed is None:
+        computed = compute_streaks()
+    saved = {
+        row[0]: to_streak_state(row[1:])
+        for row in session.query(SkillStreak.skill, *STREAK_COLUMNS)
+    }
+    # skills without a saved state get one at their next log, that is no drift
+    return {
+        skillname: (saved[skillname], state)
+        for skillname, state in computed.items()
+        if skillname in saved and saved[skillname] != state
+    }
+
+
+@retry_when_busy
+def compact_entries():
+    """Delete all entries with 0 minutes from the Entry model and shrink the database file.
+    Return the number of deleted entries"""
+    deleted = (
+        session.query(Entry)
+        .filter(Entry.minutes == 0)
+        .delete(synchronize_session=False)
+    )
+    # the 0 days are gone, so are the watermarks
+    session.query(FilledDays).delete(synchronize_session=False)
+    session.commit()  # save changes to the database
+    # give the free pages back to the file system
+    with session.get_bind().connect() as connection:
+        connection.execute("VACUUM")
+    return deleted
+
+
+# windows for the stats, as (first, last) day before today, both days included
+STATS_WINDOWS = {
+    "last_week": (0, 6),
+    "previous_week": (7, 13),
+    "last_month": (0, 29),
+    "previous_month": (30, 59),
+}
+# windows in which the number of days with the daily goal reached is counted
+GOAL_WINDOWS = {"total_goals_week": "last_week", "total_goals_month": "last_month"}
+
+
+@memoize
+def get_stats(skill_list):
+    """Return the necessary datapoints to show the stats.
+    The stats of all skills are computed in one query, with a sum for every window"""
+    today = datetime.date.today()
+
+    def days_ago(days):
+        return today - datetime.timedelta(days=days)
+
+    def in_window(window):
+        first, last = STATS_WINDOWS[window]
+        return Entry.date.between(days_ago(last), days_ago(first))
+
+    # the first entry decides if there is enough data for the weekly and monthly stats
+    first_date = (
+        session.query(func.min(Entry.date))
+        .filter(Entry.skill == Skill.name)
+        .correlate(Skill)
+        .as_scalar()
+    )
+    columns = [Skill.name, Skill.daily_goal, first_date]
+    # total minutes in each window
+    for window in STATS_WINDOWS:
+        columns.append(func.sum(case([(in_window(window), Entry.minutes)], else_=0)))
+    # days in each window where the goal was reached
+    for window in GOAL_WINDOWS.values():
+        goal_reached = and_(in_window(window), Entry.minutes >= Skill.daily_goal)
+        columns.append(func.sum(case([(goal_reached, 1)], else_=0)))
+    # only the entries of the last 60 days are needed for the sums
+    query = (
+        session.query(*columns)
+        .outerjoin(
+            Entry, and_(Entry.skill == Skill.name, Entry.date >= days_ago(59))
+        )
+        .filter(Skill.name.in_(list(skill_list)))
+        .group_by(Skill.name)
+    )
 
+    stats_dict = {}
+    for skillname, goal, first, *sums in query:
+        sums = dict(zip(list(STATS_WINDOWS) + list(GOAL_WINDOWS), sums))
+        days = (today - first).days + 1 if first else 0  # days since the first entry
+        # without a goal every day counts, also the days without entries
+        if not goal:
+            for key, window in GOAL_WINDOWS.items():
+                sums[key] = min(days, STATS_WINDOWS[window][1] + 1)
+        stats = {key: None for key in sums}
+        # weekly stats if there are datapoints for 2 weeks or more
+        if days >= 14:
+            for key in ("last_week", "previous_week", "total_goals_week"):
+                stats[key] = sums[key]
+        # monthly stats if there are datapoints for 2 months or more
+        if days >= 60:
+            for key in ("last_month", "previous_month", "total_goals_month"):
+                stats[key] = sums[key]
+        stats_dict[skillname] = stats
+
+    # keep the order of the selection
+    return {name: stats_dict[name] for name in skill_list if name in stats_dict}
+
+
+@retry_when_busy
 def delete_skill(skillname):
     """Delte the given skill in the Skill model and all entries from the Entry model"""
     skill_obj = session.query(Skill).filter_by(name=skillname)
     entry_query = session.query(Entry).filter_by(skill=skillname)
     skill_obj.delete(synchronize_session=False)  # delete skill from Skill model
     entry_query.delete(synchronize_session=False)  # delte entries from Entry model
+    session.query(SkillStreak).filter_by(skill=skillname).delete(synchronize_session=False)
+    session.query(FilledDays).filter_by(skill=skillname).delete(synchronize_session=False)
+    # delete the weekly and monthly totals
+    for model, _, _ in ROLLUPS.values():
+        session.query(model).filter_by(skill=skillname).delete(synchronize_session=False)
+    version = count_write()
     session.commit()  # save changes to the database
+    bump(skillname, version)
@@ -27,47 +27,51 @@ def print_progressbar(
         print()
 
 
-def output_summary(
-    skillname,
-    current_level,
-    next_level,
-    xp_points,
-    xp_required,
-    total_hours,
-    minutes_invested,
-    goal=None,
-):
-    """Print output to the user after they have entered some data"""
+def output_summary(summary):
+    """Print output to the user after they have entered some data, from the LogSummary of log_minutes"""
     terminal_length = shutil.get_terminal_size()[0]  # fit to the length of the termial
     # actual output
     print(
         f"\n{'~' * ((terminal_length - 8) // 2)}LEVEL UP{'~' * ((terminal_length - 8) // 2)}\n"
     )
-    print(f"{skillname} level: {current_level}".center(terminal_length))
-    print(f"Time invested today: {minutes_invested} minutes".center(terminal_length))
-    print(f"Total time invested: {round(total_hours, 1)} hours".center(terminal_length))
-    if goal:
+    print(f"{summary.skill} level: {summary.current_level}".center(terminal_length))
+    print(f"Time invested today: {summary.minutes_invested} minutes".center(terminal_length))
+    print(f"Total time invested: {round(summary.total_hours, 1)} hours".center(terminal_length))
+    if summary.goal:
         print()
-        if goal <= minutes_invested:
+        if summary.goal <= summary.minutes_invested:
             print("You have reached your daily goal!".center(terminal_length))
         else:
             print(
-                f"{minutes_invested - goal} minutes to reach your daily goal".center(
+                f"{summary.goal - summary.minutes_invested} minutes to reach your daily goal".center(
                     terminal_length
                 )
             )
     print()
+    # streaks and averages, kept up to date with every log, see streaks.py
+    print(
+        f"Streak: {summary.current_streak} days in a row (longest {summary.longest_streak})".center(
+            terminal_length
+        )
+    )
+    if summary.goal:
+        print(f"Daily goal reached {summary.goal_streak} days in a row".center(terminal_length))
+    print(
+        f"Average per day: {summary.average_week} minutes (7 days), "
+        f"{summary.average_month} minutes (30 days)".center(terminal_length)
+    )
+    print()
     print(
-        f"To reach level {next_level} you need to spend {xp_required} more hours.".center(
+        f"To reach level {summary.next_level} you need to spend {summary.xp_required} more hours.".center(
             terminal_length
         )
     )
     print()
     print_progressbar(
-        iteration=xp_points,
-        total=(next_level ** 2),
-        suffix=f"to Level {str(next_level)}",
-        length=(terminal_length - len(str(next_level)) - 20),
+        iteration=summary.xp_points,
+        total=(summary.xp_points + summary.xp_required),
+        suffix=f"to Level {str(summary.next_level)}",
+        length=(terminal_length - len(str(summary.next_level)) - 20),
     )
     print()
     print(
@@ -83,13 +87,14 @@ def show_stats(stats_dict):
     terminal_length = shutil.get_terminal_size()[0]  # fit output to terminal size
     for key, value in stats_dict.items():
         string += f"\n{'=' * ((terminal_length - (len(key) + 10)) // 2)}STATS FOR {key.upper()}{'=' * ((terminal_length - (len(key) + 10)) // 2)}\n"
+        # also compared with the month after a week without minutes
+        average_7_days = round((value["last_week"] or 0) / 7)  # None with less than 2 weeks of data
         # weekly stats
         if value["last_week"]:
             last_week = value["last_week"]
             previous_week = value["previous_week"]
             total_goals_week = value["total_goals_week"]
             delta_week = last_week - previous_week
-            average_7_days = round(last_week / 7)
             string += "\n"
             string += "WEEKLY STATS".center(terminal_length)
             string += f"""
@@ -123,6 +128,33 @@ Average minutes per day last week compared to last month: {average_7_days - aver
     return string
 
 
+def show_range_stats(stats_dict):
+    """Show total, average and goal days of the skills in a date range, see ranges.range_stats"""
+    string = ""
+    terminal_length = shutil.get_terminal_size()[0]  # fit output to terminal size
+    for key, value in stats_dict.items():
+        title = f"{key.upper()} FROM {value['first']} TO {value['last']}"
+        string += f"\n{title.center(terminal_length, '=')}\n"
+        string += f"""
+Total: {value['total']} min ({round(value['total'] / 60, 1)} hours) in {value['days']} days
+Average per day: {value['average']} min
+"""
+        if value["goal"]:
+            string += f"Daily goal reached: {value['goal_days']} times\n"
+        string += f"\n{'=' * terminal_length}\n"
+    return string
+
+
+def show_weeks(skillname, weeks):
+    """Show the minutes of every week and the change to the week before, see ranges.week_over_week"""
+    terminal_length = shutil.get_terminal_size()[0]  # fit output to terminal size
+    string = f"\n{f'WEEKS OF {skillname.upper()}'.center(terminal_length, '=')}\n\n"
+    for monday, minutes, change in weeks:
+        compared = calc_percentage(minutes, minutes - change)  # change to the week before
+        string += f"Week of {monday}: {minutes:6} min  {change:+6} min ({compared})\n"
+    return string + f"\n{'=' * terminal_length}\n"
+
+
 def lvlup_help():
     """Give the user information about the program and how to use it"""
     terminal_length = shutil.get_terminal_size()[0]  # fit to terminal size
@@ -151,6 +183,8 @@ def lvlup_help():
 
 def calc_percentage(num1, num2):
     """Calculate the appropriate percentage and return a string for show_stats"""
+    if num2 == 0:
+        return "nothing to compare with"
     base = num1 / num2 * 100
     base = round(base)
     if base >= 100:
@@ -0,0 +1,188 @@
+# Stats for any date range: total minutes, average and days with the goal reached
+# Every skill gets an index with prefix sums of its minutes and goal days, keyed by day ordinal,
+# so a range is answered with two lookups. The index is extended in place when minutes are logged
+
+import datetime
+import threading
+
+import numpy as np
+
+import cache
+import models
+
+# days added to the index at once when it runs full
+SPARE_DAYS = 64
+
+INDEXES = {}  # skill name -> (version of the skill, PrefixIndex), see stamp
+LOCK = threading.Lock()  # the server reads and logs from several threads
+
+
+class PrefixIndex:
+    """Minutes and days with the goal reached, added up from the first day of a skill.
+    Position i holds the sums of the days before start + i, position 0 is always 0"""
+
+    __slots__ = ("start", "goal", "length", "minutes", "goal_days")
+
+    def __init__(self, start, goal, minutes, goal_days, length):
+        self.start = start  # ordinal of the first day
+        self.goal = goal
+        self.length = length  # days in the index
+        self.minutes = minutes  # int64 prefix sums, with room for more days at the end
+        self.goal_days = goal_days
+
+    @classmethod
+    def from_series(cls, series):
+        """Build the index of a daily SkillSeries"""
+        length = len(series)
+        minutes = np.zeros(length + 1 + SPARE_DAYS, dtype=np.int64)
+        goal_days = np.zeros(length + 1 + SPARE_DAYS, dtype=np.int64)
+        np.cumsum(series.minutes, dtype=np.int64, out=minutes[1 : length + 1])
+        np.cumsum(series.minutes >= series.goal, dtype=np.int64, out=goal_days[1 : length + 1])
+        return cls(series.start.item().toordinal(), series.goal, minutes, goal_days, length)
+
+    def position(self, date):
+        """Return the position of the sums before a day, days outside of the index are clamped"""
+        return min(max(date.toordinal() - self.start, 0), self.length)
+
+    def total(self, first, last):
+        """Return the minutes from first to last, both days included"""
+        if last < first:
+            return 0
+        return int(
+            self.minutes[self.position(last + datetime.timedelta(days=1))]
+            - self.minutes[self.position(first)]
+        )
+
+    def count_goal_days(self, first, last):
+        """Return the days from first to last with the goal reached"""
+        if last < first:
+            return 0
+        if not self.goal:
+            # without a goal every day since the first one counts, like in get_stats
+            today = datetime.date.today().toordinal()
+            return max(min(last.toordinal(), today) - max(first.toordinal(), self.start) + 1, 0)
+        return int(
+            self.goal_days[self.position(last + datetime.timedelta(days=1))]
+            - self.goal_days[self.position(first)]
+        )
+
+    def reserve(self, days):
+        """Make room for days more at the end"""
+        needed = self.length + 1 + days
+        if needed > len(self.minutes):
+            size = max(needed, 2 * len(self.minutes))  # doubled, so appending a day is O(1) on average
+            self.minutes = np.resize(self.minutes, size)
+            self.goal_days = np.resize(self.goal_days, size)
+
+    def extend(self, date, minutes):
+        """Add minutes logged on a day. Return False for a day before the last one in the index,
+        then the index has to be built again"""
+        position = date.toordinal() - self.start
+        if self.length == 0 or position < self.length - 1:
+            return False
+        if position == self.length - 1:
+            # the last day, the goal might be reached now
+            end = self.length
+            day = int(self.minutes[end] - self.minutes[end - 1]) + minutes
+            reached_before = int(self.goal_days[end] - self.goal_days[end - 1])
+            self.minutes[end] += minutes
+            self.goal_days[end] += (day >= self.goal) - reached_before
+            return True
+        # the days in between have 0 minutes, they only reach a goal of 0
+        self.reserve(position + 1 - self.length)
+        end = self.length
+        gap = position - end
+        self.minutes[end + 1 : end + gap + 1] = self.minutes[end]
+        self.goal_days[end + 1 : end + gap + 1] = self.goal_days[end] + np.arange(1, gap + 1) * (
+            not self.goal
+        )
+        self.minutes[position + 1] = self.minutes[position] + minutes
+        self.goal_days[position + 1] = self.goal_days[position] + (minutes >= self.goal)
+        self.length = position + 1
+        return True
+
+    def weekly_totals(self):
+        """Return the monday (datetime64[D]) and the minutes of every week since the first day"""
+        if not self.length:
+            return np.array([], dtype="datetime64[D]"), np.zeros(0, dtype=np.int64)
+        first = datetime.date.fromordinal(self.start)
+        monday = first - datetime.timedelta(days=first.weekday())
+        weeks = (self.start + self.length - monday.toordinal() + 6) // 7
+        # the sums before every monday and after the last week, one lookup for each
+        boundaries = monday.toordinal() + 7 * np.arange(weeks + 1) - self.start
+        sums = self.minutes[np.clip(boundaries, 0, self.length)]
+        mondays = np.datetime64(monday, "D") + 7 * np.arange(weeks)
+        return mondays, np.diff(sums)
+
+
+def stamp(skillname):
+    """Return the version of a skill in the cache, an index of another version is out of date"""
+    return cache.VERSIONS[skillname], cache.GENERATION
+
+
+def get_indexes(skill_list):
+    """Return the PrefixIndex of every skill, the ones that are missing or out of date are built
+    from the daily series of those skills, in one query"""
+    with LOCK:
+        missing = [name for name in skill_list if INDEXES.get(name, (None,))[0] != stamp(name)]
+        if missing:
+            for skillname, series in models.get_dates_and_hours(missing).items():
+                INDEXES[skillname] = (stamp(skillname), PrefixIndex.from_series(series))
+        return {name: INDEXES[name][1] for name in skill_list}
+
+
+def get_index(skillname):
+    """Return the PrefixIndex of a skill"""
+    return get_indexes([skillname])[skillname]
+
+
+def extend_index(skillname, date, minutes):
+    """Extend the index of a skill after minutes were logged, see cache.logged.
+    An index that can't be extended is dropped and built again when it is needed"""
+    with LOCK:
+        version, index = INDEXES.get(skillname, (None, None))
+        if index is None:
+            return
+        versions, generation = stamp(skillname)
+        # the index has to be of the version right before this log
+        if version == (versions - 1, generation) and index.extend(date, minutes):
+            INDEXES[skillname] = (stamp(skillname), index)
+        else:
+            del INDEXES[skillname]
+
+
+cache.LOG_LISTENERS.append(extend_index)
+
+
+def range_stats(skill_list, first, last):
+    """Return total minutes, average per day and days with the goal reached from first to last
+    (both included) for every skill"""
+    if last < first:
+        raise ValueError(f"The range ends on {last}, before its first day {first}")
+    days = (last - first).days + 1
+    stats = {}
+    for skillname, index in get_indexes(skill_list).items():
+        total = index.total(first, last)
+        stats[skillname] = {
+            "first": first,
+            "last": last,
+            "days": days,
+            "total": total,
+            "average": round(total / days, 1) if days > 0 else 0.0,
+            "goal_days": index.count_goal_days(first, last),
+            "goal": index.goal,
+        }
+    return stats
+
+
+def year_to_date(skill_list):
+    """Return the range_stats since January 1st"""
+    today = datetime.date.today()
+    return range_stats(skill_list, today.replace(month=1, day=1), today)
+
+
+def week_over_week(skillname):
+    """Return (monday, minutes, change to the week before) for every week of a skill"""
+    mondays, totals = get_index(skillname).weekly_totals()
+    changes = np.diff(totals, prepend=0)
+    return list(zip(mondays.tolist(), totals.tolist(), changes.tolist()))
@@ -0,0 +1,130 @@
+# Render the graphs to png or svg files instead of showing them in a window, works without a display
+# Files are named by a hash of the data and style they show, a graph that didn't change is never drawn again
+
+import concurrent.futures
+import glob
+import hashlib
+import os
+import re
+import tempfile
+
+import models
+
+# raise this when graphs.py draws differently, so the cached files are drawn again
+GRAPHS_VERSION = 1
+# matplotlib backends that only write files
+FILE_BACKENDS = ("agg", "cairo", "pdf", "pgf", "ps", "svg", "template")
+# graph ranges of the insight menu: series period, graph and first point shown
+RANGES = {
+    "all": ("week", "plot_cumulated_progress", 0),
+    "month": ("day", "plot_minutes", -30),
+    "week": ("day", "plot_minutes", -7),
+}
+FORMATS = ("png", "svg")
+STYLES = ("xkcd", "plain")
+
+
+def has_display():
+    """Return True if matplotlib can show a window"""
+    import matplotlib.pyplot  # picks the backend
+
+    return matplotlib.get_backend().lower() not in FILE_BACKENDS
+
+
+def get_series(skill_list, range_name):
+    """Return the series of the skills for a graph range"""
+    period, _, _ = RANGES[range_name]
+    if period == "day":
+        return models.get_dates_and_hours(skill_list)
+    return models.get_rollup_series(skill_list, period)
+
+
+def graph_key(skills, range_name, file_format, style):
+    """Return a hash of everything a graph shows and how it looks"""
+    _, _, start = RANGES[range_name]
+    points = models.SETTINGS["graph_points"]  # the budget changes how long lines look
+    digest = hashlib.sha256(
+        repr((GRAPHS_VERSION, range_name, file_format, style, points)).encode()
+    )
+    for skillname, series in skills.items():
+        series = series[start:]
+        digest.update(skillname.encode())
+        digest.update(repr((str(series.start), series.period, int(series.goal))).encode())
+        digest.update(series.minutes.astype("int32").tobytes())
+    return digest.hexdigest()[:16]
+
+
+def graph_path(directory, skill_list, range_name, key, file_format):
+    """Return the file of a graph, named by its skills, range and hash"""
+    name = re.sub(r"[^\w.]", "_", "-".join(skill_list))
+    return f"{directory}{os.sep}{name}-{range_name}-{key}.{file_format}"
+
+
+def draw(skills, range_name, path, style):
+    """Draw a graph into its file, runs in the worker processes"""
+    import matplotlib
+
+    matplotlib.use("Agg")  # no window, also on a server without a display
+    import graphs
+
+    _, graph, start = RANGES[range_name]
+    directory, name = os.path.split(path)
+    handle, temporary = tempfile.mkstemp(suffix=os.path.splitext(name)[1], dir=directory)
+    os.close(handle)
+    try:
+        getattr(graphs, graph)(skills, start, output=temporary, style=style)
+        os.replace(temporary, path)  # a file in the cache is always complete
+    except BaseException:
+        os.remove(temporary)
+        raise
+    # the older files of the same graph are never used again
+    prefix = path[: -len(name)] + glob.escape(name.rsplit("-", 1)[0])
+    for old in glob.glob(prefix + "-*" + os.path.splitext(name)[1]):
+        if old != path:
+            os.remove(old)
+    return path
+
+
+def render_graphs(jobs, directory=None, file_format="png", style="xkcd", workers=None):
+    """Render graphs given as (skill list, range) to files, drawing them in a pool of processes.
+    Return a list of (skill list, range, path, True if it came from the cache)"""
+    directory = directory or models.SETTINGS["graph_dir"]
+    os.makedirs(directory, exist_ok=True)
+    # one query per range for all skills, the workers don't touch the database
+    series = {}
+    for range_name in {range_name for _, range_name in jobs}:
+        names = {name for skill_list, job_range in jobs if job_range == range_name for name in skill_list}
+        series[range_name] = get_series(sorted(names), range_name)
+    results = []
+    missing = []
+    for skill_list, range_name in jobs:
+        skills = {name: series[range_name][name] for name in skill_list}
+        key = graph_key(skills, range_name, file_format, style)
+        path = graph_path(directory, skill_list, range_name, key, file_format)
+        cached = os.path.exists(path)
+        results.append((skill_list, range_name, path, cached))
+        if not cached:
+            missing.append((skills, range_name, path, style))
+    if workers == 1 or len(missing) < 2:
+        for job in missing:
+            draw(*job)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+            for future in [pool.submit(draw, *job) for job in missing]:
+                future.result()  # raise the errors of the workers
+    return results
+
+
+def render_graph(skill_list, range_name, directory=None, file_format="png", style="xkcd"):
+    """Render one graph of the skills to a file, return its path"""
+    return render_graphs([(skill_list, range_name)], directory, file_format, style)[0][2]
+
+
+def render_all(directory=None, file_format="png", style="xkcd", workers=None, ranges=RANGES):
+    """Render the ranges (default all) of every skill, each skill in its own graphs"""
+    jobs = [
+        ([skillname], range_name)
+        for skillname in models.get_skill_names()
+        for range_name in ranges
+    ]
+    return render_graphs(jobs, directory, file_format, style, workers)
@@ -0,0 +1,103 @@
+# Minutes of a skill for every day, week or month, the payload of the graphs, the api and the cache
+# Only the first date and one numpy buffer of minutes are kept, the dates follow from their position
+
+import datetime
+
+import numpy as np
+
+# minutes are stored in 2 bytes while they fit, a month has at most 44640 minutes
+SMALL = np.uint16
+LARGE = np.int32
+
+
+def minutes_dtype(largest):
+    """Return the smallest type for minutes up to largest"""
+    return SMALL if largest <= np.iinfo(SMALL).max else LARGE
+
+
+class SkillSeries:
+    """Minutes of a skill for every period from a start date, with the daily goal of the skill.
+    Slices are views on the same buffer, nothing is copied"""
+
+    __slots__ = ("start", "minutes", "goal", "period")
+
+    def __init__(self, start, minutes, goal=0, period="day"):
+        self.start = np.datetime64(start, "D")  # first day of the first period
+        self.minutes = minutes  # numpy array, one value for every period
+        self.goal = goal or 0
+        self.period = period  # day, week or month
+
+    @classmethod
+    def from_entries(cls, dates_list, minutes_list, goal=0, period="day", stop=None):
+        """Build a series from sorted dates and minutes, up until stop (default today).
+        Periods without an entry get 0 minutes"""
+        dates = np.array(dates_list, dtype="datetime64[D]")
+        stop = np.datetime64(stop or datetime.date.today(), "D")
+        if not len(dates):
+            return cls(stop, np.zeros(0, dtype=SMALL), goal, period)
+        stop = max(stop, dates[-1])
+        # position of every entry in the calendar from the first entry until the stop date
+        if period == "month":
+            months = dates.astype("datetime64[M]")
+            length = (stop.astype("datetime64[M]") - months[0]).astype(int) + 1
+            positions = (months - months[0]).astype(int)
+        else:
+            step = 7 if period == "week" else 1
+            length = (stop - dates[0]).astype(int) // step + 1
+            positions = (dates - dates[0]).astype(int) // step
+        minutes = np.zeros(length, dtype=minutes_dtype(max(minutes_list)))
+        minutes[positions] = minutes_list
+        minutes.flags.writeable = False  # series are shared through the cache
+        return cls(dates[0], minutes, goal, period)
+
+    def __len__(self):
+        return len(self.minutes)
+
+    def __getitem__(self, index):
+        """Return a part of the series as a new series on the same buffer, e.g. series[-30:]"""
+        if not isinstance(index, slice) or index.step not in (None, 1):
+            raise TypeError("a series can only be sliced, without a step")
+        first, _, _ = index.indices(len(self))
+        return SkillSeries(self.date_at(first), self.minutes[index], self.goal, self.period)
+
+    def __iter__(self):
+        """Iterate over (date, minutes) of every period"""
+        for date, minutes in zip(self.dates.tolist(), self.minutes.tolist()):
+            yield date, minutes
+
+    def __repr__(self):
+        return f"SkillSeries({self.start}, {len(self)} {self.period}s, goal={self.goal})"
+
+    def date_at(self, position):
+        """Return the first day of the period at a position as datetime64[D]"""
+        if self.period == "month":
+            return (self.start.astype("datetime64[M]") + position).astype("datetime64[D]")
+        return self.start + position * (7 if self.period == "week" else 1)
+
+    @property
+    def dates(self):
+        """First day of every period as a datetime64[D] array, computed when it is needed"""
+        if self.period == "month":
+            months = np.arange(len(self)) + self.start.astype("datetime64[M]")
+            return months.astype("datetime64[D]")
+        return self.start + np.arange(len(self)) * (7 if self.period == "week" else 1)
+
+    def last(self, count):
+        """Return the last count periods"""
+        return self[-count:] if count else self[len(self) :]
+
+    def between(self, first, last):
+        """Return the periods that start between first and last, both days included"""
+        dates = self.dates
+        begin = np.searchsorted(dates, np.datetime64(first, "D"))
+        end = np.searchsorted(dates, np.datetime64(last, "D"), side="right")
+        return self[begin:end]
+
+    def total(self):
+        """Return the sum of all minutes"""
+        return int(self.minutes.sum(dtype=np.int64))
+
+    @property
+    def nbytes(self):
+        """Bytes of the buffer of minutes"""
+        return self.minutes.nbytes
@@ -0,0 +1,224 @@
+# Small HTTP/JSON api to log minutes and read levels, stats and series, for dashboards and scripts
+# Requests are handled with asyncio, reads run in a pool of threads and all writes in one thread,
+# so clients never wait on each other for the sqlite write lock
+
+import asyncio
+import concurrent.futures
+import datetime
+import json
+import re
+import urllib.parse
+
+import models
+from cache import CACHE, check
+
+# longest request body that is read, a log is a few bytes
+MAX_BODY = 1 << 16
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+class HTTPError(Exception):
+    """Error that is sent to the client with its status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def skill_parameter(skillname):
+    """Return the stored name of a skill in the url, 404 if it doesn't exist"""
+    name = models.find_skill(urllib.parse.unquote(skillname))
+    if name is None:
+        raise HTTPError(404, f"There is no skill {skillname}")
+    return name
+
+
+def list_skills(query, body):
+    """GET /skills: names of all skills"""
+    return models.get_skill_names()
+
+
+def show_level(query, body, skillname):
+    """GET /skills/<skill>: level, xp, total hours and goal"""
+    skillname = skill_parameter(skillname)
+    level = models.get_level(skillname)
+    current_level, next_level, xp_points, xp_required, total_minutes, goal = level
+    return {
+        "skill": skillname,
+        "level": current_level,
+        "next_level": next_level,
+        "xp_points": xp_points,
+        "xp_required": xp_required,
+        "total_hours": round(total_minutes / 60, 2),
+        "daily_goal": goal,
+    }
+
+
+def show_series(query, body, skillname):
+    """GET /skills/<skill>/series?period=day|week|month: minutes for every day, week or month"""
+    skillname = skill_parameter(skillname)
+    period = query.get("period", ["day"])[0]
+    if period == "day":
+        series = models.get_dates_and_hours([skillname])[skillname]
+    elif period in models.ROLLUPS:
+        series = models.get_rollup_series([skillname], period)[skillname]
+    else:
+        raise HTTPError(400, f"Unknown period {period}, choose day, week or month")
+    return {
+        "skill": skillname,
+        "period": period,
+        "dates": series.dates.astype(str).tolist(),
+        "minutes": series.minutes.tolist(),
+        "goal": int(series.goal),
+    }
+
+
+def show_stats(query, body):
+    """GET /stats?skill=<skill>&skill=...: weekly and monthly stats, default all skills"""
+    skill_list = [skill_parameter(name) for name in query.get("skill", [])]
+    return models.get_stats(skill_list or models.get_skill_names())
+
+
+def show_cache(query, body):
+    """GET /cache: hits and misses of the cache"""
+    return CACHE.counters()
+
+
+def log(query, body, skillname):
+    """POST /skills/<skill>/log with {"minutes": 30, "date": "YYYY-MM-DD"}: add minutes"""
+    skillname = skill_parameter(skillname)
+    try:
+        data = json.loads(body or b"{}")
+        minutes = data["minutes"]
+        date = data.get("date")
+        date = datetime.date.fromisoformat(date) if date else None
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise HTTPError(400, 'Send {"minutes": <minutes>, "date": "YYYY-MM-DD"}')
+    if not isinstance(minutes, int) or isinstance(minutes, bool) or minutes < 0:
+        raise HTTPError(400, "Minutes have to be an integer of 0 or more.")
+    if date and date > datetime.date.today():
+        raise HTTPError(400, f"{date} is in the future")
+    return models.log_minutes(skillname, minutes, date)._asdict()
+
+
+# method, path and function of every route, writes are marked so they run one after another
+ROUTES = [
+    ("GET", re.compile(r"/skills"), list_skills, False),
+    ("GET", re.compile(r"/skills/([^/]+)"), show_level, False),
+    ("GET", re.compile(r"/skills/([^/]+)/series"), show_series, False),
+    ("POST", re.compile(r"/skills/([^/]+)/log"), log, True),
+    ("GET", re.compile(r"/stats"), show_stats, False),
+    ("GET", re.compile(r"/cache"), show_cache, False),
+]
+
+
+def call_in_session(function, *args):
+    """Call a route in a thread with its own session, which is closed again after the request"""
+    try:
+        check()  # the cached data might be from before a write of another process
+        return function(*args)
+    finally:
+        models.session.remove()  # the connection goes back to the pool
+
+
+class Server:
+    """The api, reads go to a pool of threads and writes to a single thread"""
+
+    def __init__(self, readers=4):
+        self.readers = concurrent.futures.ThreadPoolExecutor(readers, "lvlup-read")
+        self.writer = concurrent.futures.ThreadPoolExecutor(1, "lvlup-write")
+
+    async def dispatch(self, method, target, body):
+        """Run the route of a request, return the status and the data to send"""
+        url = urllib.parse.urlsplit(target)
+        query = urllib.parse.parse_qs(url.query)
+        allowed = False
+        for route_method, pattern, function, writes in ROUTES:
+            match = pattern.fullmatch(url.path.rstrip("/") or "/")
+            if not match:
+                continue
+            if route_method != method:
+                allowed = True
+                continue
+            executor = self.writer if writes else self.readers
+            loop = asyncio.get_running_loop()
+            try:
+                data = await loop.run_in_executor(
+                    executor, call_in_session, function, query, body, *match.groups()
+                )
+            except HTTPError as error:
+                return error.status, {"error": str(error)}
+            except Exception as error:  # the server keeps running, the client gets the error
+                return 500, {"error": f"{type(error).__name__}: {error}"}
+            return 200, data
+        if allowed:
+            return 405, {"error": f"{method} is not allowed for {url.path}"}
+        return 404, {"error": f"Nothing at {url.path}"}
+
+    async def handle(self, reader, writer):
+        """Answer the requests of one connection, which is kept open between requests"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY:
+                    status, data = 413, {"error": "The request is too big."}
+                    headers["connection"] = "close"  # the body is not read
+                else:
+                    body = await reader.readexactly(length)
+                    status, data = await self.dispatch(method, target, body)
+                keep_alive = (
+                    version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                )
+                payload = json.dumps(data, default=str).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+                    "\r\n".encode("latin-1")
+                    + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass  # the client went away or didn't speak http
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        """Accept connections until the task is cancelled"""
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"LevelUp is listening on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.readers.shutdown()
+            self.writer.shutdown()
+
+
+def serve(host="127.0.0.1", port=8000, readers=4):
+    """Run the api until it is stopped with ctrl-c"""
+    try:
+        asyncio.run(Server(readers).serve(host, port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,127 @@
+# Streaks and rolling averages of a skill, the state is kept in the skill_streaks table
+# Every log moves the state of its skill forward in O(1), replay and from_history compute it from all entries
+# Only days with minutes count, a state is about the last day with minutes (last_date)
+
+import collections
+
+# days of the rolling averages, minutes of the last KEPT_DAYS days are part of the state
+WINDOWS = (7, 30)
+KEPT_DAYS = max(WINDOWS)
+
+StreakState = collections.namedtuple(
+    "StreakState",
+    [
+        "last_date",  # last day with minutes
+        "last_minutes",  # minutes on that day
+        "streak_before",  # days with minutes in a row, up to the day before last_date
+        "goal_streak_before",  # days with the goal reached in a row, up to the day before last_date
+        "longest_before",  # longest streak that ended before last_date
+        "recent",  # minutes of the KEPT_DAYS days up to last_date, oldest first
+    ],
+)
+Streaks = collections.namedtuple(
+    "Streaks", ["current_streak", "longest_streak", "goal_streak", "average_week", "average_month"]
+)
+
+
+def goal_reached(minutes, goal):
+    """Return True if the minutes of a day reach the goal, a skill without goal has no goal streak"""
+    return goal > 0 and minutes >= goal
+
+
+def advance(state, date, minutes, goal):
+    """Return the state after minutes were added to a day, in O(1).
+    None if the day is before the last day of the state, then it has to come from the history"""
+    if not minutes:
+        return state  # a day without minutes changes nothing
+    if state is None:
+        return StreakState(date, minutes, 0, 0, 0, (0,) * (KEPT_DAYS - 1) + (minutes,))
+    if date == state.last_date:
+        recent = state.recent[:-1] + (state.recent[-1] + minutes,)
+        return state._replace(last_minutes=state.last_minutes + minutes, recent=recent)
+    if date < state.last_date:
+        return None
+    gap = (date - state.last_date).days
+    # the last day is complete now, its streaks end there
+    streak = state.streak_before + 1
+    goal_streak = state.goal_streak_before + 1 if goal_reached(state.last_minutes, goal) else 0
+    # the days in between had no minutes
+    skipped = min(gap, KEPT_DAYS) - 1
+    recent = (state.recent + (0,) * skipped + (minutes,))[-KEPT_DAYS:]
+    return StreakState(
+        last_date=date,
+        last_minutes=minutes,
+        streak_before=streak if gap == 1 else 0,
+        goal_streak_before=goal_streak if gap == 1 else 0,
+        longest_before=max(state.longest_before, streak),
+        recent=recent,
+    )
+
+
+def replay(dates_list, minutes_list, goal):
+    """Compute the state from the sorted days with minutes of a skill, one day after the other.
+    Plain python, so a log that needs the history doesn't load numpy like from_history"""
+    state = None
+    for date, minutes in zip(dates_list, minutes_list):
+        state = advance(state, date, minutes, goal)
+    return state
+
+
+def run_lengths(flags):
+    """Return for every position the number of True values in a row that end there"""
+    import numpy as np
+
+    positions = np.arange(len(flags))
+    # position of the last False up to every position, -1 before the first one
+    last_false = np.maximum.accumulate(np.where(flags, -1, positions))
+    return positions - last_false
+
+
+def from_history(dates_list, minutes_list, goal):
+    """Compute the state from the sorted days with minutes of a skill, with numpy.
+    Gives the same state as advance for every day in order, None without days"""
+    import numpy as np
+
+    from series import SkillSeries
+
+    if not len(dates_list):
+        return None
+    # one value for every day up to the last one with minutes
+    minutes = SkillSeries.from_entries(dates_list, minutes_list, stop=dates_list[-1]).minutes
+    minutes = minutes.astype(np.int64)
+    streaks = run_lengths(minutes > 0)
+    goal_streaks = run_lengths(minutes >= goal) if goal > 0 else np.zeros(len(minutes), int)
+    recent = np.concatenate([np.zeros(KEPT_DAYS, np.int64), minutes])[-KEPT_DAYS:]
+    return StreakState(
+        last_date=dates_list[-1],
+        last_minutes=int(minutes[-1]),
+        streak_before=int(streaks[-2]) if len(minutes) > 1 else 0,
+        goal_streak_before=int(goal_streaks[-2]) if len(minutes) > 1 else 0,
+        longest_before=int(streaks[:-1].max(initial=0)),
+        recent=tuple(recent.tolist()),
+    )
+
+
+def summarize(state, goal, today):
+    """Return the Streaks of a state on a day: streaks that ended before yesterday are over,
+    the averages count the days without minutes since the last day as 0"""
+    if state is None:
+        return Streaks(0, 0, 0, 0.0, 0.0)
+    since = max((today - state.last_date).days, 0)
+    streak = state.streak_before + 1
+    if goal_reached(state.last_minutes, goal):
+        goal_streak = state.goal_streak_before + 1 if since <= 1 else 0
+    else:
+        # the goal can still be reached today
+        goal_streak = state.goal_streak_before if since == 0 else 0
+    averages = []
+    for window in WINDOWS:
+        days = window - since  # days of the window up to the last day
+        averages.append(round(sum(state.recent[-days:]) / window, 1) if days > 0 else 0.0)
+    return Streaks(
+        current_streak=streak if since <= 1 else 0,
+        longest_streak=max(state.longest_before, streak),
+        goal_streak=goal_streak,
+        average_week=averages[0],
+        average_month=averages[1],
+    )
@@ -0,0 +1,39 @@
+# Shared setup of the tests: the modules of the program and a database in memory
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# never the database next to main.py, also for modules imported by the tests
+os.environ["LVLUP_DATABASE_URL"] = "sqlite://"
+
+
+@pytest.fixture
+def database():
+    """An empty database in memory with the latest schema, a new one for every test"""
+    import models
+    from migrations import migrate
+
+    models.configure_storage("sqlite://")
+    migrate(models.get_engine())
+    yield models
+    models.configure_storage("sqlite://")  # drop the database
+
+
+@pytest.fixture
+def statements(database):
+    """List of the sql statements sent to the database during the test"""
+    from sqlalchemy import event
+
+    sent = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        sent.append(statement)
+
+    engine = database.get_engine()
+    event.listen(engine, "before_cursor_execute", count)
+    yield sent
+    event.remove(engine, "before_cursor_execute", count)
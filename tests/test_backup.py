@@ -0,0 +1,49 @@
+# Backups of a database file, see backup.py
+
+import datetime
+import os
+
+import pytest
+
+import backup
+
+
+@pytest.fixture
+def database_file(tmp_path, monkeypatch):
+    """A database file in the write ahead log with the skill Chess, backups in tmp_path/backups"""
+    import models
+    from migrations import migrate
+
+    monkeypatch.setitem(models.SETTINGS, "backup_dir", str(tmp_path / "backups"))
+    models.configure_storage("sqlite:///" + str(tmp_path / "level.db"), "performance")
+    migrate(models.get_engine())
+    models.session.add(models.Skill(name="Chess"))
+    models.session.commit()
+    models.log_minutes("Chess", 30)
+    yield tmp_path / "backups"
+    models.configure_storage("sqlite://")
+
+
+def test_verify_leaves_no_files_behind(database_file):
+    path = backup.create_backup(compress=False)
+    assert backup.verify_backup(path) is None
+    assert sorted(os.listdir(database_file)) == [os.path.basename(path)]
+
+
+def test_backups_of_today_are_kept(database_file):
+    first = backup.create_backup(compress=False)
+    second = backup.create_backup()
+    assert [path for _, path in backup.list_backups()] == [second, first]
+
+
+def test_older_days_keep_their_newest_backup(tmp_path):
+    today = datetime.date(2024, 3, 20)
+    names = []
+    for days, hour in [(0, 9), (0, 8), (1, 20), (1, 10), (2, 12), (30, 12), (31, 12)]:
+        created = datetime.datetime.combine(today - datetime.timedelta(days=days), datetime.time(hour))
+        name = "backup-" + created.strftime(backup.TIME_FORMAT) + ".db"
+        (tmp_path / name).write_bytes(b"")
+        names.append(name)
+    removed = backup.prune_backups(str(tmp_path), keep_daily=3, keep_weekly=2, today=today)
+    # both of today, the newest of the 2 days before and the newest of the week before
+    assert sorted(os.path.basename(path) for path in removed) == sorted([names[3], names[6]])
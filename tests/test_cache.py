@@ -0,0 +1,63 @@
+# Cached series, stats and levels, and writes of other processes, see cache.py
+
+import pytest
+
+from instrument import action
+
+
+@pytest.fixture
+def chess(database):
+    database.session.add(database.Skill(name="Chess"))
+    database.session.commit()
+    database.log_minutes("Chess", 72)
+    return database
+
+
+def write_of_another_process(models, minutes):
+    """Add minutes like another process would: in the database, without the versions of the cache"""
+    models.session.execute(models.ADD_TO_TOTAL, {"skill": "Chess", "minutes": minutes})
+    models.session.execute(models.COUNT_WRITE)
+    models.session.commit()
+
+
+def test_cached_views_send_no_sql(chess, statements):
+    with action("stats"):
+        chess.get_stats(["Chess"])
+        chess.get_level("Chess")
+    statements.clear()
+    chess.get_stats(["Chess"])
+    chess.get_level("Chess")
+    assert statements == []
+
+
+def test_data_version_is_read_once_per_action(chess, statements):
+    statements.clear()
+    with action("stats"):
+        chess.get_stats(["Chess"])
+        chess.get_level("Chess")
+        chess.get_dates_and_hours(["Chess"])
+        with action("graph"):  # counts for the outer action
+            chess.get_dates_and_hours(["Chess"])
+    assert sum("data_version" in statement for statement in statements) == 1
+
+
+def test_own_writes_keep_other_skills_cached(chess, statements):
+    chess.session.add(chess.Skill(name="Piano"))
+    chess.session.commit()
+    with action("stats"):
+        chess.get_level("Piano")
+    chess.log_minutes("Chess", 10)
+    statements.clear()
+    with action("stats"):
+        chess.get_level("Piano")
+    # only the data version is read, Piano didn't change
+    assert len(statements) == 1 and "data_version" in statements[0]
+    assert chess.get_level("Chess")[4] == 82
+
+
+def test_writes_of_other_processes_are_noticed(chess):
+    with action("stats"):
+        assert chess.get_level("Chess")[4] == 72
+    write_of_another_process(chess, 100)
+    with action("stats"):
+        assert chess.get_level("Chess")[4] == 172
@@ -0,0 +1,71 @@
+# Filling in the 0 days of dense entries, see Entry.add_null_date
+
+import datetime
+
+import pytest
+
+TODAY = datetime.date.today()
+THREE_YEARS = 3 * 365
+
+
+@pytest.fixture
+def dense(database, monkeypatch):
+    """A database with dense entries and a skill with one entry three years ago"""
+    monkeypatch.setattr(database, "SPARSE_ENTRIES", False)
+    database.session.add(database.Skill(name="Chess"))
+    database.session.execute(
+        database.UPSERT_ENTRY,
+        {"skill": "Chess", "date": TODAY - datetime.timedelta(days=THREE_YEARS), "minutes": 30},
+    )
+    database.session.commit()
+    return database
+
+
+def entry_dates(models):
+    return [date for date, in models.session.query(models.Entry.date).order_by(models.Entry.date)]
+
+
+def test_three_year_gap_in_three_statements(dense, statements):
+    statements.clear()
+    dense.Entry.add_null_date("Chess")
+    # the first day with the watermark, all 0 days in one batch and the new watermark
+    assert len(statements) == 3
+    dates = entry_dates(dense)
+    assert len(dates) == THREE_YEARS + 1
+    assert dates == [dates[0] + datetime.timedelta(days=day) for day in range(THREE_YEARS + 1)]
+
+
+def test_watermark_is_kept_in_the_database(dense, statements):
+    dense.Entry.add_null_date("Chess")
+    filled = dense.session.query(dense.FilledDays).one()
+    assert filled.filled_until == TODAY
+    statements.clear()
+    # like the next run of the program, only the watermark is read
+    dense.Entry.add_null_date("Chess")
+    assert len(statements) == 1
+    assert statements[0].startswith("SELECT")
+
+
+def test_days_before_the_watermark_are_filled(dense):
+    dense.Entry.add_null_date("Chess")
+    earlier = TODAY - datetime.timedelta(days=THREE_YEARS + 10)
+    dense.session.execute(
+        dense.UPSERT_ENTRY, {"skill": "Chess", "date": earlier, "minutes": 5}
+    )
+    dense.session.commit()
+    dense.Entry.add_null_date("Chess")
+    assert len(entry_dates(dense)) == THREE_YEARS + 11
+
+
+def test_log_fills_in_the_gap(dense):
+    dense.log_minutes("Chess", 20)
+    assert len(entry_dates(dense)) == THREE_YEARS + 1
+    assert dense.Entry.get_minutes_invested("Chess") == 20
+
+
+def test_sparse_entries_fill_nothing(database, statements):
+    database.session.add(database.Skill(name="Chess"))
+    database.session.commit()
+    statements.clear()
+    database.Entry.add_null_date("Chess")
+    assert statements == []
@@ -0,0 +1,93 @@
+# The level curves give the same levels as the loop that update_level used before levels.py
+
+import random
+
+import numpy as np
+import pytest
+
+from levels import make_curve
+
+SQUARES = [level ** 2 for level in range(1, 51)]
+
+
+def loop_level(total_minutes, hours_for=lambda level: level ** 2):
+    """The old calculate_level, subtracting the hours of every level from the total"""
+    total_hours = total_minutes / 60
+    next_level = 1
+    current_level = 0
+    while total_hours >= hours_for(next_level):
+        current_level = next_level
+        total_hours -= hours_for(next_level)
+        next_level += 1
+    xp_points = round(total_hours, 2)
+    xp_required = round(hours_for(next_level) - xp_points, 1)
+    return current_level, next_level, xp_points, xp_required
+
+
+# name and arguments of a curve with the hours of every level for the loop
+CURVES = {
+    "square": (("square",), lambda level: level ** 2),
+    "linear": (("linear",), lambda level: level),
+    "linear 3 hours": (("linear", 3), lambda level: 3 * level),
+    "table": (("table", [1, 2, 5, 10]), lambda level: [1, 2, 5, 10][min(level, 4) - 1]),
+    "table of squares": (("table", SQUARES), lambda level: SQUARES[min(level, 50) - 1]),
+}
+
+
+def largest_total(name, hours_for):
+    """Largest random total of a curve, the loop takes a step for every level
+    so the curves other than square stop at level 1000"""
+    if name == "square":
+        return 10 ** 10
+    return sum(hours_for(level) for level in range(1, 1001)) * 60
+
+
+def totals(hours_for, largest, count, seed=0):
+    """Every minute of the first levels, the minutes around the first 500 thresholds
+    and random totals up to largest"""
+    values = list(range(20000))
+    threshold = 0
+    for level in range(1, 501):
+        threshold += hours_for(level) * 60
+        values += [threshold - 1, threshold, threshold + 1]
+    generator = random.Random(seed)
+    values += [generator.randint(0, largest) for _ in range(count)]
+    return values
+
+
+@pytest.mark.parametrize("name", CURVES)
+def test_calculate_matches_the_loop(name):
+    arguments, hours_for = CURVES[name]
+    curve = make_curve(*arguments)
+    for total in totals(hours_for, largest_total(name, hours_for), 2000):
+        assert curve.calculate(total) == loop_level(total, hours_for), total
+
+
+@pytest.mark.parametrize("name", CURVES)
+def test_calculate_all_matches_calculate(name):
+    arguments, hours_for = CURVES[name]
+    curve = make_curve(*arguments)
+    values = totals(hours_for, largest_total(name, hours_for), 5000, seed=1)
+    levels, next_levels, xp_points, xp_required = curve.calculate_all(values)
+    expected = [curve.calculate(total) for total in values]
+    assert levels.tolist() == [row[0] for row in expected]
+    assert next_levels.tolist() == [row[1] for row in expected]
+    assert xp_points.tolist() == [row[2] for row in expected]
+    assert xp_required.tolist() == [row[3] for row in expected]
+
+
+def test_exponential_levels_are_consistent():
+    curve = make_curve("exponential", 1, 1.5)
+    values = np.arange(0, 10 ** 6, 7)
+    levels = curve.levels(values)
+    assert (np.diff(levels) >= 0).all()
+    assert levels.tolist() == [curve.level(int(total)) for total in values]
+    # the level is reached exactly at its threshold and not a minute before
+    for level in range(1, 20):
+        assert curve.level(curve.threshold(level)) == level
+        assert curve.level(curve.threshold(level) - 1) == level - 1
+
+
+def test_unknown_curve():
+    with pytest.raises(ValueError):
+        make_curve("cubic")
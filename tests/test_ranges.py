@@ -0,0 +1,41 @@
+# Stats of any date range from the prefix sums, see ranges.py
+
+import datetime
+import random
+
+import pytest
+
+import ranges
+
+TODAY = datetime.date.today()
+
+
+@pytest.fixture
+def chess(database):
+    """Chess with random minutes on random days of the last 200 days"""
+    database.session.add(database.Skill(name="Chess", daily_goal=30))
+    database.session.commit()
+    generator = random.Random(0)
+    logged = {}
+    for _ in range(150):
+        date = TODAY - datetime.timedelta(days=generator.randrange(200))
+        minutes = generator.choice([5, 20, 45])
+        database.log_minutes("Chess", minutes, date)
+        logged[date] = logged.get(date, 0) + minutes
+    return logged
+
+
+def test_ranges_match_the_entries(chess):
+    generator = random.Random(1)
+    for _ in range(200):
+        first = TODAY - datetime.timedelta(days=generator.randrange(-5, 220))
+        last = first + datetime.timedelta(days=generator.randrange(60))
+        stats = ranges.range_stats(["Chess"], first, last)["Chess"]
+        days = [minutes for date, minutes in chess.items() if first <= date <= last]
+        assert stats["total"] == sum(days)
+        assert stats["goal_days"] == sum(minutes >= 30 for minutes in days)
+
+
+def test_reversed_range(chess):
+    with pytest.raises(ValueError):
+        ranges.range_stats(["Chess"], TODAY, TODAY - datetime.timedelta(days=1))
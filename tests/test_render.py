@@ -0,0 +1,51 @@
+# Rendering the graphs of many skills to files, see render.py
+
+import datetime
+import os
+
+import matplotlib
+import pytest
+
+matplotlib.use("Agg")  # never a window, also in the worker processes
+
+from render import RANGES, render_all
+
+SKILLS = 50
+
+
+@pytest.fixture
+def skills(database, monkeypatch):
+    """50 skills with a few weeks of minutes each"""
+    monkeypatch.setenv("MPLBACKEND", "Agg")
+    today = datetime.date.today()
+    entries = []
+    for skill in range(SKILLS):
+        database.session.add(database.Skill(name=f"Skill{skill}"))
+        entries += [
+            {
+                "skill": f"Skill{skill}",
+                "date": today - datetime.timedelta(days=day),
+                "minutes": skill + day,
+            }
+            for day in range(1, 22)
+        ]
+    database.session.execute(database.UPSERT_ENTRY, entries)
+    database.add_to_rollups(entries)
+    database.session.commit()
+    return database
+
+
+def test_render_all_skills(skills, tmp_path):
+    results = render_all(str(tmp_path), style="plain")
+    assert len(results) == SKILLS * len(RANGES)
+    assert {tuple(skill_list) for skill_list, *_ in results} == {
+        (f"Skill{skill}",) for skill in range(SKILLS)
+    }
+    for *_, path, cached in results:
+        assert not cached
+        assert os.path.getsize(path) > 0
+    # nothing changed, so every graph comes from the files of the first run
+    again = render_all(str(tmp_path), style="plain")
+    assert all(cached for *_, cached in again)
+    assert [path for *_, path, _ in again] == [path for *_, path, _ in results]
+    assert len(os.listdir(tmp_path)) == SKILLS * len(RANGES)
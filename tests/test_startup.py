@@ -0,0 +1,62 @@
+# Logging from the command line loads none of the heavy modules, see cli.py
+
+import datetime
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+HEAVY = ("matplotlib", "inquirer", "numpy")
+# runs main.py like the command line does and prints the heavy modules that were loaded
+RUN_MAIN = f"""
+import runpy, sys
+sys.argv = ["main.py"] + sys.argv[1:]
+try:
+    runpy.run_path({os.path.join(ROOT, "main.py")!r}, run_name="__main__")
+finally:
+    loaded = {{name.split(".")[0] for name in sys.modules}}
+    print("loaded:", " ".join(sorted(loaded & set({HEAVY!r}))))
+"""
+
+
+@pytest.fixture
+def scratch(tmp_path):
+    """Url of a database file with the skill Chess"""
+    import models
+    from migrations import migrate
+
+    url = "sqlite:///" + str(tmp_path / "level.db")
+    models.configure_storage(url)
+    migrate(models.get_engine())
+    models.session.add(models.Skill(name="Chess"))
+    models.session.commit()
+    models.configure_storage("sqlite://")
+    return url
+
+
+def log(url, *arguments):
+    """Run main.py log in a new process, return the heavy modules it loaded"""
+    environment = dict(os.environ, LVLUP_DATABASE_URL=url)
+    result = subprocess.run(
+        [sys.executable, "-c", RUN_MAIN, "log", *arguments],
+        env=environment,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert "Chess:" in result.stdout
+    return result.stdout.rsplit("loaded:", 1)[1].split()
+
+
+def test_log_loads_no_heavy_modules(scratch):
+    assert log(scratch, "chess", "30") == []  # the first log computes the streak from the entries
+    assert log(scratch, "chess", "15") == []
+
+
+def test_log_of_an_earlier_day_loads_no_heavy_modules(scratch):
+    log(scratch, "chess", "30")
+    earlier = datetime.date.today() - datetime.timedelta(days=3)
+    assert log(scratch, "chess", "20", "--date", earlier.isoformat()) == []
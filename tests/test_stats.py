@@ -0,0 +1,42 @@
+# The stats of get_stats shown by show_stats, also for skills with little data
+
+import datetime
+
+import pytest
+
+from output import show_stats
+
+TODAY = datetime.date.today()
+
+
+@pytest.fixture
+def chess(database):
+    database.session.add(database.Skill(name="Chess"))
+    database.session.commit()
+    return database
+
+
+def log_days_ago(models, days, minutes):
+    models.log_minutes("Chess", minutes, TODAY - datetime.timedelta(days=days))
+
+
+def test_no_data(chess):
+    stats = chess.get_stats(["Chess"])
+    assert stats["Chess"]["last_week"] is None
+    assert "Not enough data" in show_stats(stats)
+
+
+def test_new_skill_with_minutes_today(chess):
+    log_days_ago(chess, 0, 30)
+    assert "Not enough data" in show_stats(chess.get_stats(["Chess"]))
+
+
+def test_no_minutes_in_the_last_week(chess):
+    log_days_ago(chess, 90, 30)
+    log_days_ago(chess, 20, 40)
+    stats = chess.get_stats(["Chess"])
+    assert stats["Chess"]["last_week"] == 0
+    assert stats["Chess"]["last_month"] == 40
+    text = show_stats(stats)
+    assert "Total minutes this month: 40 min" in text
+    assert "last week compared to last month: -1 min" in text
@@ -0,0 +1,75 @@
+# The streaks moved forward with every log match the ones computed from all entries, see streaks.py
+
+import datetime
+import random
+
+import pytest
+
+import streaks
+
+TODAY = datetime.date.today()
+
+
+def random_history(generator, days):
+    """Advance through random logs of every day: gaps, several logs a day and 0 minutes.
+    Return the goal, the state and the minutes of every day with minutes"""
+    goal = generator.choice([0, 15, 30, 60])
+    first = TODAY - datetime.timedelta(days=days)
+    state = None
+    logged = {}
+    for day in range(days):
+        date = first + datetime.timedelta(days=day)
+        for _ in range(generator.choice([0, 0, 1, 1, 2])):
+            minutes = generator.choice([0, 5, 20, 45, 90])
+            state = streaks.advance(state, date, minutes, goal)
+            if minutes:
+                logged[date] = logged.get(date, 0) + minutes
+    return goal, state, logged
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_advance_matches_the_history(seed):
+    generator = random.Random(seed)
+    for _ in range(40):
+        goal, state, logged = random_history(generator, generator.choice([1, 5, 40, 400]))
+        dates = sorted(logged)
+        minutes = [logged[date] for date in dates]
+        assert streaks.from_history(dates, minutes, goal) == state
+        assert streaks.replay(dates, minutes, goal) == state
+
+
+def test_no_history():
+    assert streaks.from_history([], [], 30) is None
+    assert streaks.replay([], [], 30) is None
+    assert streaks.summarize(None, 30, TODAY) == streaks.Streaks(0, 0, 0, 0.0, 0.0)
+
+
+def test_streak_ends_after_a_day_off():
+    day = datetime.timedelta(days=1)
+    state = None
+    for date in (TODAY - 4 * day, TODAY - 3 * day, TODAY - 2 * day):
+        state = streaks.advance(state, date, 30, 30)
+    assert streaks.summarize(state, 30, TODAY - 2 * day).current_streak == 3
+    assert streaks.summarize(state, 30, TODAY - day).current_streak == 3
+    summary = streaks.summarize(state, 30, TODAY)
+    assert (summary.current_streak, summary.longest_streak, summary.goal_streak) == (0, 3, 0)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_log_minutes_matches_the_entries(database, seed):
+    generator = random.Random(seed)
+    skill_list = [f"Skill{skill}" for skill in range(5)]
+    for skillname in skill_list:
+        database.session.add(database.Skill(name=skillname, daily_goal=generator.choice([0, 30])))
+    database.session.commit()
+    for log in range(600):
+        skillname = generator.choice(skill_list)
+        late = generator.random() < 0.05  # now and then a day in the past
+        day = generator.randrange(200) if late else generator.randrange(3)
+        database.log_minutes(
+            skillname, generator.choice([0, 10, 30, 60]), TODAY - datetime.timedelta(days=day)
+        )
+        if log % 100 == 0:
+            database.save_goal(skillname, generator.choice([0, 15, 30]))
+    assert database.check_streaks() == {}
+    assert database.rebuild_streaks() == {}
@@ -0,0 +1,62 @@
+# Logging from several processes at once loses no minutes, see retry_when_busy and log_minutes
+
+import collections
+import multiprocessing
+
+import pytest
+
+from benchmark import stress_worker
+
+PROCESSES = 4
+LOGS = 50
+SKILLS = 3
+
+
+@pytest.fixture
+def url(database, tmp_path):
+    """Url of a database file with the skills, no connection of this process is open"""
+    from migrations import migrate
+
+    url = "sqlite:///" + str(tmp_path / "level.db")
+    database.configure_storage(url, "performance")
+    migrate(database.get_engine())
+    for skill in range(SKILLS):
+        database.session.add(database.Skill(name=f"Skill{skill}"))
+    database.session.commit()
+    database.configure_storage("sqlite://")
+    return url
+
+
+def rows(models, sql):
+    return set(map(tuple, models.session.execute(sql)))
+
+
+def test_processes_logging_at_once(database, url):
+    # spawned, so no process inherits the connections of another one
+    with multiprocessing.get_context("spawn").Pool(PROCESSES) as pool:
+        results = pool.starmap(
+            stress_worker,
+            [(url, "performance", LOGS, SKILLS, seed) for seed in range(PROCESSES)],
+        )
+    logged = sum(results, collections.Counter())
+    assert sum(logged.values()) > 0
+    database.configure_storage(url, "performance")
+    stored = collections.Counter(
+        {
+            (skill, str(date)): minutes
+            for skill, date, minutes in database.session.execute(
+                "SELECT skill, date, minutes FROM entries WHERE minutes != 0"
+            )
+        }
+    )
+    assert stored == logged
+    assert database.check_totals() == {}
+    for skill in database.session.query(database.Skill):
+        level, _, xp_points, _ = database.calculate_level(skill.total_minutes)
+        assert (skill.current_level, skill.xp_points) == (level, xp_points)
+    weekly = rows(database, "SELECT * FROM skill_weekly")
+    monthly = rows(database, "SELECT * FROM skill_monthly")
+    database.rebuild_rollups()
+    assert rows(database, "SELECT * FROM skill_weekly") == weekly
+    assert rows(database, "SELECT * FROM skill_monthly") == monthly
+    assert database.check_streaks() == {}